@@ -0,0 +1,293 @@
+"""Benchmarks of Resource hot paths, run against temporary in-memory SQLite
+tables with `manage.py benchmark <name> [--size N]`.
+"""
+__author__ = 'Azharul'
+
+import json
+import time
+import collections
+import sqlalchemy as sa
+from sqlalchemy import orm
+from formencode import validators
+
+from core.model import Model
+from core.serializer import get_serializer, json_default
+from core.resource import Resource
+from core.validators import ModelValidator
+
+benchmarks = collections.OrderedDict()  #: name: function(size=default) returning [(label, seconds, statements)]
+
+metadata = sa.MetaData()
+
+party_table = sa.Table('bench_party', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(100)),
+    sa.Column('amount', sa.Float),
+    sa.Column('inactive', sa.Boolean, default=False),
+    sa.Column('deleted', sa.Boolean, default=False),
+    sa.Column('created', sa.String(30)),
+    sa.Column('updated', sa.String(30)))
+
+
+class Party(Model):
+    pass
+
+party_mapper = orm.mapper(Party, party_table)
+
+
+class PartyValidator(ModelValidator):
+    name = validators.String(not_empty=True)
+    amount = validators.Number()
+
+
+class PartyResource(Resource):
+    mapper = party_mapper
+    validate_with = PartyValidator
+
+
+group_table = sa.Table('bench_group', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(100)),
+    sa.Column('created', sa.String(30)),
+    sa.Column('updated', sa.String(30)))
+
+group_member_table = sa.Table('bench_group_member', metadata,
+    sa.Column('group_id', sa.Integer, sa.ForeignKey('bench_group.id'), primary_key=True),
+    sa.Column('party_id', sa.Integer, sa.ForeignKey('bench_party.id'), primary_key=True))
+
+
+class Group(Model):
+    pass
+
+group_mapper = orm.mapper(Group, group_table, properties={
+    'members': orm.relationship(Party, secondary=group_member_table),
+})
+
+
+class GroupValidator(ModelValidator):
+    name = validators.String(not_empty=True)
+    members = validators.Set()
+
+
+class GroupResource(Resource):
+    mapper = group_mapper
+    validate_with = GroupValidator
+
+
+invoice_table = sa.Table('bench_invoice', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('number', sa.String(20)),
+    sa.Column('created', sa.String(30)),
+    sa.Column('updated', sa.String(30)))
+
+invoice_line_table = sa.Table('bench_invoice_line', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('invoice_id', sa.Integer, sa.ForeignKey('bench_invoice.id')),
+    sa.Column('description', sa.String(100)),
+    sa.Column('quantity', sa.Integer),
+    sa.Column('amount', sa.Float),
+    sa.Column('created', sa.String(30)),
+    sa.Column('updated', sa.String(30)))
+
+
+class Invoice(Model):
+    pass
+
+class InvoiceLine(Model):
+    pass
+
+orm.mapper(InvoiceLine, invoice_line_table)
+invoice_mapper = orm.mapper(Invoice, invoice_table, properties={
+    'lines': orm.relationship(InvoiceLine, cascade='all, delete-orphan'),
+})
+
+
+class InvoiceValidator(ModelValidator):
+    number = validators.String(not_empty=True)
+    lines = validators.Set()
+
+
+class InvoiceResource(Resource):
+    mapper = invoice_mapper
+    validate_with = InvoiceValidator
+
+
+def benchmark(func):
+    benchmarks[func.__name__] = func
+    return func
+
+
+class Database(object):
+    """Temporary in-memory database with the benchmark tables, counting the
+    executed statements
+    """
+    def __init__(self):
+        self.engine = sa.create_engine('sqlite://')
+        metadata.create_all(self.engine)
+        self.session = orm.scoped_session(orm.sessionmaker(bind=self.engine, autoflush=False))
+        self.statements = 0
+        sa.event.listen(self.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.statements += 1
+
+    def resource(self, resource_class):
+        resource = resource_class()
+        resource.session = self.session
+        return resource
+
+    def measure(self, label, func, *args, **kwargs):
+        """Runs `func` and returns (label, seconds, statements)
+        """
+        self.statements = 0
+        start = time.time()
+        func(*args, **kwargs)
+        return label, time.time() - start, self.statements
+
+    def reset(self, *tables):
+        for table in tables:
+            self.session.execute(table.delete())
+        self.session.commit()
+
+
+def _party_rows(size):
+    return [{'Party': {'name': 'Party %d' % i, 'amount': '%d.50' % i}} for i in range(size)]
+
+
+@benchmark
+def bulk_create(size=10000):
+    """`Resource.bulk_create` of `size` parties, with and without reading back the keys,
+    compared with `Resource.create` per row
+    """
+    db = Database()
+    resource = db.resource(PartyResource)
+    rows = _party_rows(size)
+
+    results = [db.measure('bulk_create', resource.bulk_create, rows, commit=True)]
+    db.reset(party_table)
+    results.append(db.measure('bulk_create(return_keys=False)', resource.bulk_create, rows, commit=True, return_keys=False))
+    db.reset(party_table)
+
+    def create_each():
+        for row in rows:
+            resource.create(row)
+        resource.session.commit()
+    results.append(db.measure('create per row', create_each))
+    return results
+
+
+@benchmark
+def many_to_many(size=10000):
+    """Linking a group to `size` parties, then updating the membership unchanged
+    and with one member replaced, see `Resource._sync_many_to_many`
+    """
+    db = Database()
+    db.resource(PartyResource).bulk_create(_party_rows(size + 1), commit=True, return_keys=False)
+    resource = db.resource(GroupResource)
+    group = resource.create({'Group': {'name': 'Group', 'members': []}}, commit=True)
+
+    members = [{'party_id': pk} for pk in range(1, size + 1)]
+    replaced = members[1:] + [{'party_id': size + 1}]
+    return [
+        db.measure('link %d members' % size, resource.update, {'Group': {'name': 'Group', 'members': members}},
+                   group, commit=True),
+        db.measure('update unchanged', resource.update, {'Group': {'name': 'Group', 'members': members}},
+                   group, enable_delete=True, commit=True),
+        db.measure('replace 1 member', resource.update, {'Group': {'name': 'Group', 'members': replaced}},
+                   group, enable_delete=True, commit=True),
+    ]
+
+
+def _update_by_properties(resource, mapper, data, model):
+    """`Resource._update` as it was before the write plans of user-004: every key
+    is looked up with `get_property` and dispatched on its type, `direction` and
+    `uselist`. The handlers are shared, so only the dispatch differs.
+    """
+    for k, v in data.iteritems():
+        try:
+            prop = mapper.get_property(k)
+        except sa.exc.InvalidRequestError:
+            continue
+
+        if isinstance(prop, orm.RelationshipProperty):
+            if prop.direction is orm.interfaces.MANYTOMANY:
+                resource._update_many_to_many(mapper, model, prop, v)
+            elif prop.uselist:
+                # nested models are walked the same way
+                pk = prop.mapper.primary_key[0].key
+                collection = getattr(model, prop.key)
+                related_models = dict((getattr(inner, pk), inner) for inner in collection)
+                for inner_dict in v:
+                    id = inner_dict.get(pk)
+                    if id:
+                        _update_by_properties(resource, prop.mapper, inner_dict, related_models.pop(id))
+                    else:
+                        collection.append(_update_by_properties(resource, prop.mapper, inner_dict, prop.mapper.class_()))
+                resource._to_delete.extend(related_models.values())
+            else:
+                resource._update_scalar(mapper, model, prop, v)
+        else:
+            setattr(model, prop.key, v)
+
+    resource._post_process(model)
+    return model
+
+
+@benchmark
+def nested_update(size=1000):
+    """Creating an invoice with `size` lines and updating all of them through
+    `Resource._update`, before (property lookups per key, see `_update_by_properties`)
+    and after (compiled write plans), then with flushing
+    """
+    db = Database()
+    resource = db.resource(InvoiceResource)
+    lines = [{'description': 'Line %d' % i, 'quantity': i, 'amount': i * 10} for i in range(size)]
+    invoice = resource.create({'Invoice': {'number': 'INV-1', 'lines': lines}}, commit=True)
+
+    changed = [{'id': line.id, 'description': line.description, 'quantity': line.quantity + 1, 'amount': line.amount}
+               for line in invoice.lines]
+    data = {'Invoice': {'number': 'INV-1', 'lines': changed}}
+    cleaned_data = resource.validate(data)
+    return [
+        db.measure('_update of %d lines, before' % size, _update_by_properties, resource, invoice_mapper, cleaned_data, invoice),
+        db.measure('_update of %d lines' % size, resource._update, invoice_mapper, cleaned_data, invoice),
+        db.measure('update of %d lines' % size, resource.update, data, invoice, commit=True),
+    ]
+
+
+@benchmark
+def rows(size=10000):
+    """Reading `size` parties as models, as column tuples through the ORM and
+    as named tuples with `Resource.rows`
+    """
+    db = Database()
+    resource = db.resource(PartyResource)
+    resource.bulk_create(_party_rows(size), commit=True, return_keys=False)
+
+    def read(func):
+        func()
+        resource.session.expunge_all()
+    return [
+        db.measure('query().all() models', read, lambda: resource.query().all()),
+        db.measure('query(columns).all() tuples', read, lambda: resource.query('id', 'name', 'amount').all()),
+        db.measure('rows(columns)', read, lambda: resource.rows('id', 'name', 'amount')),
+    ]
+
+
+@benchmark
+def serialize(size=10000):
+    """Converting `size` parties to dicts and JSON with the compiled serializer,
+    compared with the `Model` mapping interface `to_dict` used before
+    """
+    db = Database()
+    resource = db.resource(PartyResource)
+    resource.bulk_create(_party_rows(size), commit=True, return_keys=False)
+    models = resource.query().all()
+    serializer = get_serializer(Party)
+
+    return [
+        db.measure('dict(model.iteritems())', lambda: [dict(model.iteritems()) for model in models]),
+        db.measure('Serializer.to_list', serializer.to_list, models),
+        db.measure('json.dumps(Serializer.to_list)', lambda: json.dumps(serializer.to_list(models), default=json_default)),
+        db.measure('Serializer.to_json', serializer.to_json, models),
+    ]
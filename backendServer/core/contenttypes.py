@@ -0,0 +1,133 @@
+__author__ = 'Azharul'
+
+import threading
+import sqlalchemy as sa
+
+from core.dbconfig import metaData, engine
+
+
+content_types_table = sa.Table(
+    'content_types', metaData,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('table_name', sa.String(64), nullable=False, unique=True),
+)
+
+
+class ContentTypeRegistry(object):
+    """Maps table names to small integer ids, persisted in `content_types` table
+    and cached in process. Generic relation tables can store `type_id` instead
+    of `table_name`, making the (type_id, table_key) index much smaller::
+
+        class Address(Model):
+            # columns: id, type_id, table_key, ...
+            __table_args__ = (Index('ix_addresses_owner', 'type_id', 'table_key'),)
+
+    Ids are created in a separate transaction, so a rolled back request doesn't
+    leave cached ids without a row.
+    """
+    def __init__(self, bind=None):
+        self.bind = bind or engine
+        self._ids = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def get_id(self, table_name):
+        """Returns id of `table_name`, registering the table on first use
+        """
+        type_id = self._ids.get(table_name)
+        if type_id is None:
+            with self._lock:
+                type_id = self._ids.get(table_name) or self._register(table_name)
+        return type_id
+
+    def cached_id(self, table_name):
+        """Returns id of `table_name` if it's already known to this process, None otherwise
+        """
+        return self._ids.get(table_name)
+
+    def find_id(self, table_name):
+        """Returns id of `table_name`, read from `content_types` if it's not cached,
+        None if the table isn't registered. Unlike `get_id` it never writes.
+        """
+        type_id = self._ids.get(table_name)
+        if type_id is None:
+            select = sa.select([content_types_table.c.id]).where(content_types_table.c.table_name == table_name)
+            with self.bind.connect() as connection:
+                type_id = connection.execute(select).scalar()
+            if type_id is not None:
+                self._cache(type_id, table_name)
+        return type_id
+
+    def get_table_name(self, type_id):
+        """Returns table name of a content type id
+        """
+        if type_id not in self._names:
+            self.reload()
+        return self._names[type_id]
+
+    def reload(self):
+        """Reads all registered content types
+        """
+        with self.bind.connect() as connection:
+            rows = connection.execute(sa.select([content_types_table.c.id, content_types_table.c.table_name])).fetchall()
+
+        for type_id, table_name in rows:
+            self._cache(type_id, table_name)
+
+    def _register(self, table_name):
+        column = content_types_table.c.table_name
+        select = sa.select([content_types_table.c.id]).where(column == table_name)
+
+        with self.bind.begin() as connection:
+            type_id = connection.execute(select).scalar()
+            if type_id is None:
+                try:
+                    type_id = connection.execute(content_types_table.insert().values(table_name=table_name)).inserted_primary_key[0]
+                except sa.exc.IntegrityError:
+                    # registered concurrently by another process
+                    type_id = None
+
+        if type_id is None:
+            with self.bind.connect() as connection:
+                type_id = connection.execute(select).scalar()
+
+        self._cache(type_id, table_name)
+        return type_id
+
+    def _cache(self, type_id, table_name):
+        self._ids[table_name] = type_id
+        self._names[type_id] = table_name
+
+
+registry = ContentTypeRegistry()
+
+
+def migrate_generic_relation(related_table, bind=None):
+    """Fills `type_id` of existing rows of a generic relation table from their
+    `table_name`, registering the content types as needed. Rows already having
+    `type_id` are not changed.
+
+    :param related_table: Table (or mapped class) having `table_name` and `type_id` columns
+
+    :return: number of updated rows
+    """
+    related_table = getattr(related_table, '__table__', related_table)
+    bind = bind or engine
+
+    with bind.connect() as connection:
+        table_names = [row[0] for row in connection.execute(sa.select([related_table.c.table_name]).distinct())]
+
+    updated = 0
+    for table_name in table_names:
+        if table_name is None:
+            continue
+        type_id = registry.get_id(table_name)
+        with bind.begin() as connection:
+            updated += connection.execute(
+                related_table.update()
+                    .where(related_table.c.table_name == table_name)
+                    .where(related_table.c.type_id == None)
+                    .values(type_id=type_id)
+            ).rowcount
+
+    return updated
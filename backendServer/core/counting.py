@@ -0,0 +1,93 @@
+__author__ = 'Azharul'
+
+import json
+import hashlib
+
+from core import threadlocal
+from core.utils.datastructures import LRUCache
+
+
+def count_query(query):
+    """Counts the rows of `query` without ORDER BY and eager loads, which only
+    make the count subquery more expensive
+    """
+    return query.order_by(None).enable_eagerloads(False).count()
+
+def fingerprint(query):
+    """Returns a hash of the compiled SQL and bind parameters of `query`
+    """
+    compiled = query.statement.compile()
+    params = sorted((k, repr(v)) for k, v in compiled.params.items())
+    return hashlib.sha1((str(compiled) + repr(params)).encode('utf-8')).hexdigest()
+
+
+class ExactCount(object):
+    """Default count strategy of `Resource.paginate`. A count strategy is a callable
+    which takes a query and returns (number of records, exact)
+    """
+    def __call__(self, query):
+        return count_query(query), True
+
+
+class CachedCount(ExactCount):
+    """Caches the counts for `ttl` seconds, by query fingerprint and `company_id`
+    of the current user. Stale counts are acceptable for pagination, the cache
+    is not invalidated on writes.
+    """
+    def __init__(self, ttl=60, maxsize=1024):
+        self.cache = LRUCache(maxsize, ttl)
+
+    def __call__(self, query):
+        user = threadlocal.get_current_user()
+        key = (fingerprint(query), getattr(user, 'company_id', None))
+
+        result = self.cache.get(key)
+        if result is None:
+            result = super(CachedCount, self).__call__(query)
+            self.cache.set(key, result)
+
+        return result
+
+
+class EstimatedCount(ExactCount):
+    """Uses the row estimate of the database planner (PostgreSQL, MySQL) instead
+    of counting, when the estimate is `threshold` or more. Smaller results, other
+    databases and failed estimates fall back to an exact count.
+    """
+    def __init__(self, threshold=10000):
+        self.threshold = threshold
+
+    def __call__(self, query):
+        try:
+            estimate = self.estimate(query)
+        except Exception:
+            estimate = None
+
+        if estimate is None or estimate < self.threshold:
+            return super(EstimatedCount, self).__call__(query)
+
+        return estimate, False
+
+    def estimate(self, query):
+        """Returns planner estimate of the number of rows of `query`, None if
+        the database doesn't provide one
+        """
+        connection = query.session.connection()
+        dialect = connection.dialect
+        if dialect.name not in ('postgresql', 'mysql'):
+            return None
+
+        compiled = query.order_by(None).enable_eagerloads(False).statement.compile(dialect=dialect)
+        params = [compiled.params[k] for k in compiled.positiontup] if compiled.positional else compiled.params
+
+        if dialect.name == 'postgresql':
+            plan = connection.execute('EXPLAIN (FORMAT JSON) ' + compiled.string, params).scalar()
+            if not isinstance(plan, list):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+        row = connection.execute('EXPLAIN ' + compiled.string, params).first()
+        return int(row['rows']) if row and row['rows'] is not None else None
+
+
+exact_count = ExactCount()
@@ -1,25 +1,159 @@
 __author__ = 'Azharul'
 
+import time
+import random
+import contextlib
 import sqlalchemy as sa
-from sqlalchemy import orm
+from sqlalchemy import orm, event
+from sqlalchemy.engine.url import URL
 from django.conf import settings
 
+from core.pool import InstrumentedQueuePool, enable_pre_ping
 
-DBEngin = settings.DATABASES['default']['ENGINE'].rpartition('.')[-1]
 
-connection_string = ('{0}://{USER}:{PASSWORD}@{HOST}:{PORT}/{NAME}').format(DBEngin, **settings.DATABASES['default'])
-if DBEngin == 'mysql':
-    connection_string += '?charset=utf8'
+_drivernames = {'sqlite3': 'sqlite', 'postgresql_psycopg2': 'postgresql'}
+
+def connection_url(database):
+    """Returns SQLAlchemy URL of a Django `DATABASES` entry
+    """
+    backend = database['ENGINE'].rpartition('.')[-1]
+    drivername = _drivernames.get(backend, backend)
+    return URL(drivername,
+               username=database.get('USER') or None,
+               password=database.get('PASSWORD') or None,
+               host=database.get('HOST') or None,
+               port=database.get('PORT') or None,
+               database=database.get('NAME'),
+               query={'charset': 'utf8'} if drivername == 'mysql' else None)
+
+#: Connection pool options, overridden by `DATABASE_POOL` setting
+pool_options = {
+    'SIZE': 20,             # connections kept open
+    'MAX_OVERFLOW': 10,     # connections opened on top of SIZE under load, -1 for unlimited
+    'TIMEOUT': 30,          # seconds to wait for a connection before raising TimeoutError
+    'RECYCLE': 3600,        # seconds after which a connection is reopened
+    'PRE_PING': True,       # test connections on checkout
+    'LIFO': False,          # reuse the most recently returned connection first
+    'STATS_DIR': None,      # directory for pool telemetry snapshots of the worker processes
+}
+pool_options.update(getattr(settings, 'DATABASE_POOL', {}))
+
+def create_engine(database):
+    """Creates engine for a Django `DATABASES` entry, with a bounded
+    `InstrumentedQueuePool` configured by `pool_options`
+    """
+    url = connection_url(database)
+    options = {'pool_recycle': pool_options['RECYCLE']}
+    # SQLite file databases don't use a connection pool
+    if url.drivername != 'sqlite':
+        options.update(poolclass=InstrumentedQueuePool,
+                       pool_size=pool_options['SIZE'],
+                       max_overflow=pool_options['MAX_OVERFLOW'],
+                       pool_timeout=pool_options['TIMEOUT'],
+                       use_lifo=pool_options['LIFO'])
+
+    engine = sa.create_engine(url, **options)
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.dump_dir = pool_options['STATS_DIR']
+    if pool_options['PRE_PING']:
+        enable_pre_ping(engine)
+    return engine
+
+
+DBEngin = connection_url(settings.DATABASES['default']).drivername
 
 metaData = sa.MetaData()
-engine = sa.create_engine(connection_string, pool_recycle=3600, pool_size=20, max_overflow=-1)
+engine = create_engine(settings.DATABASES['default'])
 metaData.bind = engine
 engine.echo = False
 
+#: Read only replicas of the default database, by names in `DATABASES` listed in `DATABASE_REPLICAS`
+replica_engines = [create_engine(settings.DATABASES[name]) for name in getattr(settings, 'DATABASE_REPLICAS', ())]
+
+
+class RoutingSession(orm.Session):
+    """Session sending SELECT statements to one of the `replicas` engines, chosen
+    once per session, and everything else to the primary engine (`bind`).
+
+    Reads go to the primary as well while the session is flushing, inside
+    `use_primary`, during a transaction that has written, and for `sticky_seconds`
+    after such a transaction is committed, so a request reads its own writes
+    despite replication lag. Without replicas it behaves like a plain Session.
+    """
+    def __init__(self, replicas=(), sticky_seconds=5, **kwargs):
+        super(RoutingSession, self).__init__(**kwargs)
+        self.replicas = list(replicas)
+        self.sticky_seconds = sticky_seconds
+        self.replica = random.choice(self.replicas) if self.replicas else None
+        self._primary_depth = 0
+        self._written = False
+        self._last_write = None
+
+    def get_bind(self, mapper=None, clause=None):
+        # locking reads (SELECT ... FOR UPDATE) are writes for routing purposes
+        read = isinstance(clause, sa.sql.expression.SelectBase) and getattr(clause, '_for_update_arg', None) is None
+        if self.replica is not None and read and not self.use_primary_for_reads():
+            return self.replica
+
+        # requests without a clause (bulk_insert_mappings, connection()) may write as well
+        if not read:
+            self._written = True
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+    def use_primary_for_reads(self):
+        return self._flushing or self._primary_depth or self._written or \
+               (self._last_write is not None and time.time() - self._last_write < self.sticky_seconds)
 
-session_maker = sa.orm.sessionmaker(bind=engine, autoflush=False)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    session._written = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    if session._written:
+        session._last_write = time.time()
+        session._written = False
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(session):
+    session._written = False
+
+
+@contextlib.contextmanager
+def use_primary(session):
+    """Sends all statements of `session` (a Session or scoped_session) to the
+    primary engine inside the block::
+
+        with use_primary(self.session):
+            ...
+    """
+    if isinstance(session, orm.scoped_session):
+        session = session.registry()
+
+    if not isinstance(session, RoutingSession):
+        yield session
+        return
+
+    session._primary_depth += 1
+    try:
+        yield session
+    finally:
+        session._primary_depth -= 1
+
+
+session_maker = sa.orm.sessionmaker(bind=engine, autoflush=False, class_=RoutingSession, replicas=replica_engines,
+                                    sticky_seconds=getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 5))
 
 
 
 def create_session():
-    return sa.orm.scoped_session(session_maker)
\ No newline at end of file
+    return sa.orm.scoped_session(session_maker)
+
+
+# opt-in slow query log, see core.slowlog
+if getattr(settings, 'SLOW_QUERY_THRESHOLD', None) is not None:
+    from core import slowlog
+    slowlog.enable(engine, settings.SLOW_QUERY_THRESHOLD, getattr(settings, 'SLOW_QUERY_LOG_FILE', None))
+    for replica_engine in replica_engines:
+        slowlog.instrumentation.install(replica_engine)
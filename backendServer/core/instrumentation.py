@@ -0,0 +1,99 @@
+__author__ = 'Azharul'
+
+import re
+import time
+import collections
+from sqlalchemy import event
+
+from core import threadlocal
+
+__all__ = ['install', 'add_collector', 'remove_collector', 'fingerprint', 'RequestStats', 'start_request', 'end_request', 'request_stats']
+
+_collectors = []    #: callables receiving (connection, statement, parameters, duration, cursor) of every executed statement
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_whitespace = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """Normalizes `statement` so that executions differing only in literal values
+    or the length of IN lists have the same fingerprint
+    """
+    statement = _literals.sub('?', statement)
+    statement = re.sub(r'%\(\w+\)s|%s|:\w+', '?', statement)
+    statement = _in_lists.sub('IN (...)', statement)
+    return _whitespace.sub(' ', statement).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._instrumentation_start = time.time()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_instrumentation_start', None)
+    if start is None:
+        return
+
+    duration = time.time() - start
+    for collector in _collectors:
+        collector(conn, statement, parameters, duration, cursor)
+
+
+def install(engine):
+    """Installs the statement timing listeners on `engine`, once
+    """
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+def add_collector(collector):
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+def remove_collector(collector):
+    if collector in _collectors:
+        _collectors.remove(collector)
+
+
+class RequestStats(object):
+    """Statement count, total database time and executions per statement
+    fingerprint of a single request
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = collections.Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        """Returns [(fingerprint, count)] of statements executed more than
+        `threshold` times, N+1 query candidates
+        """
+        return [(f, n) for f, n in self.fingerprints.most_common() if n > threshold]
+
+
+def start_request():
+    threadlocal.set('sql_stats', RequestStats())
+
+def end_request():
+    stats = threadlocal.get('sql_stats')
+    threadlocal.set('sql_stats', None)
+    return stats
+
+def request_stats():
+    """Returns RequestStats of the current request, None if not instrumented
+    """
+    return threadlocal.get('sql_stats')
+
+
+def _record_request_stats(conn, statement, parameters, duration, cursor):
+    stats = threadlocal.get('sql_stats')
+    if stats is not None:
+        stats.record(statement, duration)
+
+add_collector(_record_request_stats)
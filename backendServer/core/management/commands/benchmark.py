@@ -0,0 +1,29 @@
+__author__ = 'Azharul'
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import threadlocal
+
+
+class Command(BaseCommand):
+    help = "Runs a benchmark of core.benchmarks against temporary in-memory SQLite tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help="Benchmark to run, all if omitted")
+        parser.add_argument('--size', type=int, help="Number of rows, defaults to the benchmark's own size")
+
+    def handle(self, *args, **options):
+        from core.benchmarks import benchmarks
+
+        names = [options['name']] if options['name'] else list(benchmarks)
+        for name in names:
+            if name not in benchmarks:
+                raise CommandError("Unknown benchmark %s, available: %s" % (name, ', '.join(benchmarks)))
+
+            self.stdout.write(name)
+            kwargs = {'size': options['size']} if options['size'] else {}
+            try:
+                for label, seconds, statements in benchmarks[name](**kwargs):
+                    self.stdout.write("  %-40s %8.3fs %8d statements" % (label, seconds, statements))
+            finally:
+                threadlocal.cleanup()
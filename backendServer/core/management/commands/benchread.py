@@ -0,0 +1,39 @@
+__author__ = 'Azharul'
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from core import threadlocal
+
+
+class Command(BaseCommand):
+    help = "Measures Resource.read(pk) throughput with and without compiled (baked) queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', help="Dotted path of the Resource class")
+        parser.add_argument('pk', help="Primary key to read")
+        parser.add_argument('--iterations', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            resource_class = import_string(options['resource'])
+        except ImportError as e:
+            raise CommandError(str(e))
+
+        resource = resource_class()
+        if resource.read(options['pk']) is None:
+            raise CommandError("No %s with primary key %s" % (resource.model.__name__, options['pk']))
+
+        try:
+            for bake in (False, True):
+                resource.bake_queries = bake
+                resource.read(options['pk'])
+                start = time.time()
+                for _ in range(options['iterations']):
+                    resource.read(options['pk'])
+                elapsed = time.time() - start
+                self.stdout.write("%s: %d reads in %.3fs, %.0f reads/s" % (
+                    'baked' if bake else 'query', options['iterations'], elapsed, options['iterations'] / elapsed))
+        finally:
+            threadlocal.cleanup()
@@ -0,0 +1,26 @@
+__author__ = 'Azharul'
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import pool
+from core.dbconfig import engine, replica_engines, pool_options
+
+
+class Command(BaseCommand):
+    help = "Shows connection pool telemetry of the worker processes (DATABASE_POOL['STATS_DIR'])"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=pool_options['STATS_DIR'], help="Pool snapshot directory")
+        parser.add_argument('--local', action='store_true', help="Show pools of this process instead")
+
+    def handle(self, *args, **options):
+        if options['local']:
+            rows = [dict(status, name=url) for url, status in pool.pool_status([engine] + replica_engines).items()]
+        elif options['dir']:
+            rows = [dict(status, name='pid %s' % status['pid']) for status in pool.read_snapshots(options['dir'])]
+        else:
+            raise CommandError("No snapshot directory, use --dir or set DATABASE_POOL['STATS_DIR']")
+
+        for row in rows:
+            self.stdout.write("%(name)s: size %(size)d, in use %(in_use)d, idle %(idle)d, overflow %(overflow)d/%(max_overflow)d, "
+                              "checkouts %(checkouts)d, timeouts %(timeouts)d, wait avg %(wait_avg).4fs max %(wait_max).4fs" % row)
@@ -0,0 +1,37 @@
+__author__ = 'Azharul'
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import slowlog
+
+
+class Command(BaseCommand):
+    help = "Aggregates the slow query log (SLOW_QUERY_LOG_FILE) by statement fingerprint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=getattr(settings, 'SLOW_QUERY_LOG_FILE', None),
+                            help="Slow query log file, defaults to SLOW_QUERY_LOG_FILE setting")
+        parser.add_argument('--limit', type=int, default=20, help="Number of statements to show")
+        parser.add_argument('--sort', default='total', choices=['total', 'count', 'p50', 'p95', 'max', 'rows'])
+        parser.add_argument('--plans', action='store_true', help="Show captured query plans")
+
+    def handle(self, *args, **options):
+        if not options['file']:
+            raise CommandError("No log file, use --file or set SLOW_QUERY_LOG_FILE")
+
+        try:
+            groups = slowlog.aggregate(slowlog.read_log(options['file']))
+        except IOError as e:
+            raise CommandError(str(e))
+
+        # unknown row counts (drivers without rowcount for SELECT) sort last
+        groups.sort(key=lambda g: (g[options['sort']] is not None, g[options['sort']]), reverse=True)
+        for group in groups[:options['limit']]:
+            self.stdout.write("count %(count)d  total %(total).3fs  p50 %(p50).3fs  p95 %(p95).3fs  "
+                              "max %(max).3fs  rows %(rows)s" % dict(group, rows='?' if group['rows'] is None else group['rows']))
+            self.stdout.write("    " + group['fingerprint'])
+            if options['plans'] and group['plan']:
+                for row in group['plan']:
+                    self.stdout.write("        " + ' | '.join(row))
+            self.stdout.write("")
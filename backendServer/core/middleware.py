@@ -0,0 +1,131 @@
+__author__ = 'Azharul'
+
+import time
+import logging
+from django.conf import settings
+
+from core import instrumentation, threadlocal
+from core.dbconfig import engine, replica_engines
+
+logger = logging.getLogger(__name__)
+
+
+class SQLInstrumentationMiddleware(object):
+    """Records number of statements, database time and repeated statements of
+    every request. Statements executed more than `SQL_N_PLUS_ONE_THRESHOLD`
+    times (default 10) in a request are logged as N+1 query candidates.
+
+    Adds `X-SQL-Queries`, `X-SQL-Time` (milliseconds) and, for N+1 candidates,
+    `X-SQL-N-Plus-One` (number of repeated statements) response headers.
+    It must come after `DBSessionMiddleware` in `MIDDLEWARE`.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'SQL_N_PLUS_ONE_THRESHOLD', 10)
+        for e in [engine] + replica_engines:
+            instrumentation.install(e)
+
+    def __call__(self, request):
+        instrumentation.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = instrumentation.end_request()
+
+        # None if the thread local state was cleaned up by a middleware running inside this one
+        if stats is None:
+            return response
+
+        response['X-SQL-Queries'] = str(stats.count)
+        response['X-SQL-Time'] = '%.1f' % (stats.duration * 1000)
+
+        repeated = stats.repeated(self.threshold)
+        if repeated:
+            response['X-SQL-N-Plus-One'] = str(len(repeated))
+            for statement, count in repeated:
+                logger.warning('N+1 candidate in %s %s: %d executions of %s',
+                               request.method, request.path, count, statement)
+
+        return response
+
+
+def _end_session(session, commit):
+    """Commits or rolls back the transaction of `session` (a Session) and
+    returns its connection to the pool
+    """
+    try:
+        if commit:
+            session.commit()
+        else:
+            session.rollback()
+    finally:
+        session.close()
+
+
+class DBSessionMiddleware(object):
+    """Ends the request's database session, created on demand by
+    `threadlocal.db_session()`. The transaction is committed for successful
+    responses (status < 400) and rolled back otherwise, the connection is
+    returned to the pool and the thread local state is cleaned up.
+
+    Streaming responses are committed before the body is sent. Statements
+    executed while streaming run in a new transaction, which is ended after the
+    last chunk, so no connection is held while the client reads.
+
+    The session lifetime is added as `X-DB-Session-Time` (milliseconds) response
+    header. It should be the first entry of `MIDDLEWARE`.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threadlocal.set('request', request)
+        try:
+            response = self.get_response(request)
+        except Exception:
+            self.end(threadlocal.get('session'), False)
+            raise
+
+        # queries built by the view are bound to the request's Session and keep
+        # using it while streaming, even after the scoped session is removed
+        scoped = threadlocal.get('session')
+        session = scoped.registry() if scoped is not None and scoped.registry.has() else None
+        lifetime = self.end(scoped, response.status_code < 400)
+        if lifetime is not None:
+            response['X-DB-Session-Time'] = '%.1f' % (lifetime * 1000)
+
+        if response.streaming:
+            response.streaming_content = self.stream(response.streaming_content, scoped, session, request)
+        return response
+
+    def end(self, scoped, commit):
+        """Ends the Session of `scoped` (a scoped_session), removes it and cleans
+        up the thread local state. Returns the session lifetime in seconds, None
+        if no session was used.
+        """
+        started = threadlocal.get('session_started')
+        try:
+            if scoped is not None:
+                if scoped.registry.has():
+                    _end_session(scoped.registry(), commit)
+                scoped.remove()
+        finally:
+            threadlocal.cleanup()
+
+        return time.time() - started if scoped is not None and started is not None else None
+
+    def stream(self, content, scoped, session, request):
+        start, completed = time.time(), False
+        try:
+            for chunk in content:
+                yield chunk
+            completed = True
+        finally:
+            try:
+                if session is not None:
+                    _end_session(session, completed)
+            finally:
+                # sessions opened while streaming, by resources of the view or new ones
+                self.end(scoped, completed)
+                self.end(threadlocal.get('session'), completed)
+            logger.debug('Streamed %s %s in %.1f ms', request.method, request.path, (time.time() - start) * 1000)
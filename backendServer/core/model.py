@@ -1,12 +1,13 @@
 __author__ = 'Azharul'
 
-import copy
 import datetime
 import decimal
 from collections import MutableMapping
-from sqlalchemy import orm, Table, Column, Integer, String, DateTime, Boolean
+from sqlalchemy import orm, event, or_, and_, Table, Column, Integer, String, DateTime, Boolean
 from django.utils.encoding import python_2_unicode_compatible
-from core.page import Page
+from core.page import Page, keyset_paginate
+from core.serializer import get_serializer
+from core.contenttypes import registry
 from core import threadlocal
 
 
@@ -58,8 +59,19 @@ class Model(MutableMapping):
     def __str__(self):
         return self.__repr__()
 
-    def to_dict(self):
-        return dict(self.iteritems())
+    def to_dict(self, extra=(), related=None):
+        """Returns mapped column values, optional `extra` properties and `related`
+        relationships as dict, see `core.serializer.Serializer`
+        """
+        try:
+            serializer = get_serializer(self.__class__, extra, related)
+        except orm.exc.UnmappedClassError:
+            return dict(self.iteritems())
+
+        return serializer.to_dict(self)
+
+    def to_json(self, extra=(), related=None):
+        return get_serializer(self.__class__, extra, related).to_json(self)
 
     @property
     def session(self):
@@ -84,17 +96,49 @@ class Model(MutableMapping):
             return 'Active'
 
 
+_generic_relation_prefix = '_generic_relation_'   #: instance __dict__ keys of bound GenericRelation views
+
+
+@event.listens_for(Model, 'expire', propagate=True)
+def _expire_generic_relations(model, attrs):
+    """Drops the bound GenericRelation views of an expired model (e.g. after
+    commit), so objects loaded by `Resource.prefetch_generic` are not served stale
+    """
+    if model is None:   # garbage collected
+        return
+    for key in [k for k in model.__dict__ if k.startswith(_generic_relation_prefix)]:
+        del model.__dict__[key]
+
+
+@event.listens_for(Model, 'before_insert', propagate=True)
+def _fill_type_id(mapper, connection, model):
+    """Fills `type_id` of new generic relation rows written with `table_name` only.
+    Only ids already known to the process are used, registering a table needs
+    another transaction while the flush holds the database. Rows left without
+    `type_id` are found by `table_name`, see `GenericRelation.owner_filter`.
+    """
+    if 'type_id' in mapper.attrs and getattr(model, 'type_id', None) is None and getattr(model, 'table_name', None):
+        model.type_id = registry.cached_id(model.table_name)
+
+
 class QueryProperty(object):
     """Base class of Generic Relationship properties. Implements SQLAlchemy's Query like interface
     for querying objects related via Generic Relationship.
+
+    If the objects were loaded by `Resource.prefetch_generic`, iteration, `get`,
+    `all`, `first`, `last` and `count` are served from memory.
     """
+    _prefetched = None  #: list of prefetched objects, None if not prefetched
+
     def query(self):
         raise NotImplementedError
 
     def __iter__(self):
-        return iter(self.query())
+        return iter(self._prefetched if self._prefetched is not None else self.query())
 
     def __getitem__(self, item):
+        if self._prefetched is not None:
+            return self._prefetched[item]
         return self.query().__getitem__(item)
 
     @property
@@ -105,22 +149,38 @@ class QueryProperty(object):
         return self.query().filter(*args)
 
     def get(self, id):
+        if self._prefetched is not None:
+            return next((obj for obj in self._prefetched if obj.id == id), None)
         return self.query().filter(self.related_class.id == id).first()
 
     def all(self):
+        if self._prefetched is not None:
+            return list(self._prefetched)
         return self.query().all()
 
     def first(self):
+        if self._prefetched is not None:
+            return self._prefetched[0] if self._prefetched else None
         return self.query().first()
 
     def last(self):
+        if self._prefetched is not None:
+            return max(self._prefetched, key=lambda obj: obj.id) if self._prefetched else None
         return self.query().order_by(self.related_class.id.desc()).limit(1).first()
 
     def count(self):
+        if self._prefetched is not None:
+            return len(self._prefetched)
         return self.query().count()
 
-    def paginate(self, query=None, page=1, limit=10):
+    def paginate(self, query=None, page=1, limit=10, cursor=None, order_by=None):
+        """Paginates the related objects by page number, or by keyset when
+        `cursor` or `order_by` is given (see `core.page.keyset_paginate`)
+        """
         query = query or self.query()
+        if cursor is not None or order_by is not None:
+            return keyset_paginate(query, order_by or (), self.related_class.id, cursor, limit)
+
         page = Page(page, limit, query.count())
         offset = (page.page - 1) * page.limit
         page.rows = query.limit(page.limit).offset(offset).all()
@@ -136,12 +196,25 @@ class ListProperty(QueryProperty):
         self.type = polymorphic_identity
 
     def __get__(self, instance, owner):
-        self.relation = instance
-        self.related_class = instance.related_class
-        if not hasattr(self.related_class, 'type'):
-            raise TypeError("%s doesn't have 'type' property" % repr(self.related_class))
+        if instance is None:
+            return self
+
+        # bound copies are cached in the bound GenericRelation, shared state is never modified
+        lists = instance.__dict__.get('_lists')
+        bound = lists.get(self) if lists is not None else None
+        if bound is None:
+            if not hasattr(instance.related_class, 'type'):
+                raise TypeError("%s doesn't have 'type' property" % repr(instance.related_class))
+
+            bound = object.__new__(type(self))
+            bound.__dict__.update(self.__dict__, relation=instance, related_class=instance.related_class)
+            prefetched = instance.__dict__.get('_prefetched_types')
+            if prefetched is not None and self.type in prefetched:
+                bound._prefetched = prefetched[self.type]
+            if lists is not None:
+                lists[self] = bound
 
-        return self
+        return bound
 
     def query(self):
         """Query for getting the objects in collection
@@ -155,13 +228,16 @@ class ListProperty(QueryProperty):
         if not hasattr(self.related_class, 'default'):
             raise TypeError("%s doesn't have 'default' property" % repr(self.related_class))
 
+        if self._prefetched is not None:
+            return next((obj for obj in self._prefetched if obj.default), None)
         return self.query().filter(self.related_class.default == True).first()
 
 
 class GenericRelation(QueryProperty):
     """Property for associating any type of object with another type of object
     without changing schema. The related class must have `table_name` and `table_key`
-    column to support Generic Relationship.
+    column to support Generic Relationship. If the related class has `type_id`
+    column, it's used instead of `table_name`, see `core.contenttypes`.
     """
     def __init__(self, related_class):
         """
@@ -170,23 +246,68 @@ class GenericRelation(QueryProperty):
         self.related_class = related_class
         self._type_map = dict([(getattr(self, attr).type, attr) for attr in dir(self)
                                if isinstance(getattr(self, attr), QueryProperty) and hasattr(getattr(self, attr), 'type')])
+        self._table_names = {}  #: base table name, by model class
+        self._cache_key = '%s%d' % (_generic_relation_prefix, id(self))
 
     def __get__(self, instance, owner):
         if instance is None:
             return self
 
-        clone = copy.deepcopy(self)
-        clone.table_name = orm.object_mapper(instance).base_mapper.mapped_table.name
-        clone.model = instance
-        return clone
+        view = instance.__dict__.get(self._cache_key)
+        if view is None:
+            view = instance.__dict__[self._cache_key] = self.bind(instance)
+        return view
+
+    def bind(self, instance):
+        """Returns a copy of the relation bound to `instance`. The copy shares all
+        state of the relation, which is never modified, and is cached on `instance`
+        by `__get__`.
+        """
+        cls = instance.__class__
+        table_name = self._table_names.get(cls)
+        if table_name is None:
+            table_name = self._table_names[cls] = orm.object_mapper(instance).base_mapper.mapped_table.name
+
+        view = object.__new__(type(self))
+        view.__dict__.update(self.__dict__, table_name=table_name, model=instance, _lists={})
+        return view
+
+    def prefetch(self, objects, types=None):
+        """Sets the related objects of a bound relation, loaded by `Resource.prefetch_generic`.
+        They are served until the model is expired, e.g. by `Session.commit` or `Session.expire`.
+
+        :param objects: list of all related objects, or only the ones having `types` as `type`
+        :param types: Optional, `type` values of the ListProperties `objects` were loaded for
+        """
+        prefetched = dict((t, []) for t in (types or self._type_map))
+        for obj in objects:
+            if getattr(obj, 'type', None) in prefetched:
+                prefetched[obj.type].append(obj)
+
+        self._prefetched = list(objects) if types is None else None
+        self._prefetched_types = prefetched
+        self._lists = {}
 
     def query(self):
         """Query for getting the related objects
         """
         return self.session.query(self.related_class) \
-                .filter(self.related_class.table_name == self.table_name) \
+                .filter(self.owner_filter()) \
                 .filter(self.related_class.table_key == self.model.id)
 
+    def owner_filter(self):
+        """Condition matching related objects of the bound model's table. Rows
+        without `type_id`, written before it was filled on insert, are matched by
+        `table_name` until `core.contenttypes.migrate_generic_relation` is run.
+        Reads don't register the table: if it has no id yet, no row can have its `type_id`.
+        """
+        related_class = self.related_class
+        type_id = registry.find_id(self.table_name) if hasattr(related_class, 'type_id') else None
+        if type_id is not None:
+            return or_(related_class.type_id == type_id,
+                       and_(related_class.type_id == None, related_class.table_name == self.table_name))
+        return related_class.table_name == self.table_name
+
     def get_property(self, polymorphic_identity):
         """Returns ListProperty for accessing a subset of the related objects,
         differntiated by value of the `type` column in the related object.
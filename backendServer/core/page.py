@@ -1,4 +1,11 @@
 import math
+import json
+import collections
+import base64
+import decimal
+import datetime
+import sqlalchemy as sa
+from sqlalchemy.sql import operators
 
 def pagelimit(options, default_limit=None):
     try: page = int(options.get('page', 1))
@@ -10,15 +17,142 @@ def pagelimit(options, default_limit=None):
     return {'page': page, 'limit':limit}
 
 class Page(object):
-    def __init__(self, page, limit, records):
+    def __init__(self, page, limit, records, exact=True):
         self.page = int(page)
         self.limit = int(limit) if limit else records
         self.records = records
+        self.exact = exact  #: False if `records` is an estimate
         self.rows = []
         self.total = int(math.ceil(float(self.records) / self.limit)) if records else 1
         
         if (self.page > self.total) or (self.page < 1):
             self.page = self.total
 
+    def metadata(self):
+        """Returns the fields of the page in a JSON envelope, besides `rows`"""
+        return collections.OrderedDict([('page', self.page), ('total', self.total), ('records', self.records),
+                                        ('exact', self.exact)])
+
     def __str__(self):
         return 'page %s, total %s, records: %s\nrows %s' % (self.page, self.total, self.records, self.rows.__str__())
+
+
+class CursorPage(Page):
+    """Page of a keyset (cursor) paginated query. Position is given by opaque
+    `next_cursor`/`prev_cursor` tokens instead of page number, total number of
+    `records` and pages is not computed.
+    """
+    def __init__(self, limit, cursor=None):
+        self.page = None
+        self.limit = limit
+        self.records = None
+        self.exact = False
+        self.rows = []
+        self.total = None
+        self.cursor = cursor
+        self.next_cursor = None
+        self.prev_cursor = None
+
+    def metadata(self):
+        data = super(CursorPage, self).metadata()
+        data['next_cursor'] = self.next_cursor
+        data['prev_cursor'] = self.prev_cursor
+        return data
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    elif isinstance(value, datetime.date):
+        return {'d': value.isoformat()}
+    elif isinstance(value, decimal.Decimal):
+        return {'n': str(value)}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.datetime.strptime(value['dt'], '%Y-%m-%dT%H:%M:%S.%f' if '.' in value['dt'] else '%Y-%m-%dT%H:%M:%S')
+        elif 'd' in value:
+            return datetime.datetime.strptime(value['d'], '%Y-%m-%d').date()
+        return decimal.Decimal(value['n'])
+    return value
+
+def encode_cursor(backwards, values):
+    """Returns opaque cursor for seeking after (or before, if `backwards`) a row
+    having the given ordering `values`
+    """
+    data = json.dumps({'b': backwards, 'v': [_encode_value(v) for v in values]})
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Returns (backwards, values) of a cursor created by `encode_cursor`
+
+    :raises ValueError: if `cursor` is malformed
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(str(cursor)).decode('utf-8'))
+        return bool(data['b']), [_decode_value(v) for v in data['v']]
+    except (TypeError, KeyError, ValueError, decimal.InvalidOperation):
+        raise ValueError('Invalid cursor %r' % cursor)
+
+
+def _seek_column(clause):
+    """Returns (column, descending) for an ORDER BY clause
+    """
+    modifier = getattr(clause, 'modifier', None)
+    if modifier in (operators.desc_op, operators.asc_op):
+        return clause.element, modifier is operators.desc_op
+    return clause, False
+
+def keyset_paginate(query, order_by, pk, cursor=None, limit=None):
+    """Keyset (seek) pagination of `query`. Rows are ordered by `order_by` columns
+    followed by `pk`, and the page is selected by comparing with the ordering values
+    of the last (or first) row of the previous page instead of OFFSET, so the cost
+    doesn't grow with page depth and concurrent inserts don't shift pages.
+
+    Ordering columns must not contain NULL values.
+
+    :param query: sqlalchemy query object
+    :param order_by: list of columns to order by, `column.desc()` for descending order
+    :param pk: primary key column, makes the ordering unique
+    :param cursor: Optional, `next_cursor` or `prev_cursor` of a previous page. First page if not given
+    :param limit: number of rows in a page
+
+    :return: CursorPage object with rows and cursors for the adjacent pages
+
+    :raises ValueError: if `cursor` is malformed or doesn't match the ordering columns
+    """
+    columns = [_seek_column(clause) for clause in list(order_by) + [pk]]
+    backwards, values = decode_cursor(cursor) if cursor else (False, None)
+    if values is not None and len(values) != len(columns):
+        raise ValueError('Cursor %r does not match the ordering columns' % cursor)
+
+    # going backwards, read the previous rows in reverse order
+    ordering = [(column, descending != backwards) for column, descending in columns]
+    query = query.order_by(None).order_by(*[column.desc() if descending else column.asc()
+                                            for column, descending in ordering])
+    if values is not None:
+        # (a > :a) OR (a = :a AND b > :b) OR ..., works with mixed directions
+        query = query.filter(sa.or_(*[
+            sa.and_(*([column == value for (column, _), value in zip(ordering[:i], values[:i])] +
+                      [ordering[i][0] < values[i] if ordering[i][1] else ordering[i][0] > values[i]]))
+            for i in range(len(ordering))
+        ]))
+
+    rows = (query.limit(limit + 1) if limit else query).all()
+    more = bool(limit) and len(rows) > limit
+    rows = rows[:limit] if limit else rows
+    if backwards:
+        rows.reverse()
+
+    page = CursorPage(limit, cursor)
+    page.rows = rows
+    if rows:
+        row_values = lambda row: [getattr(row, column.key) for column, _ in columns]
+        if (values is not None) if backwards else more:
+            page.next_cursor = encode_cursor(False, row_values(rows[-1]))
+        if more if backwards else (values is not None):
+            page.prev_cursor = encode_cursor(True, row_values(rows[0]))
+
+    return page
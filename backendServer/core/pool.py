@@ -0,0 +1,152 @@
+__author__ = 'Azharul'
+
+import os
+import glob
+import json
+import time
+import threading
+from sqlalchemy import exc, event, select
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import queue as sqla_queue
+
+__all__ = ['InstrumentedQueuePool', 'PoolStats', 'enable_pre_ping', 'pool_status', 'read_snapshots']
+
+
+class _LifoQueue(sqla_queue.Queue):
+    def _get(self):
+        return self.queue.pop()
+
+
+class PoolStats(object):
+    """Checkout telemetry of a connection pool
+    """
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool measuring how long checkouts wait for a connection and counting
+    checkout timeouts, see `PoolStats`. With `use_lifo`, the most recently
+    returned connection is reused first, so surplus idle connections can be
+    recycled by the server and `pool_recycle`.
+    """
+    dump_dir = None         #: if set, `status()` of the process is written here, see `read_snapshots`
+    dump_interval = 10      #: seconds between two writes to `dump_dir`
+
+    def __init__(self, creator, use_lifo=False, **kw):
+        QueuePool.__init__(self, creator, **kw)
+        self.use_lifo = use_lifo
+        if use_lifo:
+            self._pool = _LifoQueue(self._pool.maxsize)
+        self.stats = PoolStats()
+        self._waiting = threading.local()
+        self._dumped = 0
+
+    def _do_get(self):
+        # QueuePool._do_get calls itself again when it loses a race for overflow
+        if getattr(self._waiting, 'active', False):
+            return QueuePool._do_get(self)
+
+        self._waiting.active = True
+        start = time.time()
+        try:
+            conn = QueuePool._do_get(self)
+        except exc.TimeoutError:
+            self.stats.record(time.time() - start, True)
+            raise
+        finally:
+            self._waiting.active = False
+
+        self.stats.record(time.time() - start)
+        return conn
+
+    def _do_return_conn(self, conn):
+        QueuePool._do_return_conn(self, conn)
+        if self.dump_dir and time.time() - self._dumped > self.dump_interval:
+            self._dumped = time.time()
+            self.dump()
+
+    def recreate(self):
+        pool = QueuePool.recreate(self)
+        if self.use_lifo:
+            pool.use_lifo = True
+            pool._pool = _LifoQueue(pool._pool.maxsize)
+        pool.stats = self.stats
+        return pool
+
+    def status(self):
+        """Returns pool telemetry as dict
+        """
+        stats = self.stats
+        return {
+            'size': self.size(),
+            'max_overflow': self._max_overflow,
+            'in_use': self.checkedout(),
+            'idle': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+            'checkouts': stats.checkouts,
+            'timeouts': stats.timeouts,
+            'wait_avg': stats.wait_total / stats.checkouts if stats.checkouts else 0.0,
+            'wait_max': stats.wait_max,
+        }
+
+    def dump(self):
+        path = os.path.join(self.dump_dir, 'pool-%d-%s.json' % (os.getpid(), self._orig_logging_name or id(self)))
+        try:
+            with open(path, 'w') as f:
+                json.dump(dict(self.status(), pid=os.getpid(), time=time.time()), f)
+        except (IOError, OSError):
+            pass
+
+
+def enable_pre_ping(engine):
+    """Tests connections with `SELECT 1` when they are checked out from the pool,
+    reconnecting if the database dropped them
+    """
+    @event.listens_for(engine, 'engine_connect')
+    def ping_connection(connection, branch):
+        if branch:
+            return
+
+        # don't close the connection when the ping's result is closed
+        should_close_with_result = connection.should_close_with_result
+        connection.should_close_with_result = False
+        try:
+            connection.scalar(select([1]))
+        except exc.DBAPIError as e:
+            # invalidated connection is reconnected by the next statement
+            if e.connection_invalidated:
+                connection.scalar(select([1]))
+            else:
+                raise
+        finally:
+            connection.should_close_with_result = should_close_with_result
+
+
+def pool_status(engines):
+    """Returns {engine url: status} of the instrumented pools of `engines`
+    """
+    return dict((repr(e.url), e.pool.status()) for e in engines if isinstance(e.pool, InstrumentedQueuePool))
+
+def read_snapshots(dump_dir):
+    """Returns pool status snapshots written by the worker processes to `dump_dir`
+    """
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(dump_dir, 'pool-*.json'))):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (IOError, OSError, ValueError):
+            continue
+    return snapshots
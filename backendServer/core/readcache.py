@@ -0,0 +1,193 @@
+__author__ = 'Azharul'
+
+import time
+import sqlite3
+import threading
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from sqlalchemy import orm, event
+from sqlalchemy.orm.attributes import instance_state
+
+from core.utils.datastructures import LRUCache
+
+__all__ = ['ReadCache', 'LocalReadCache', 'SQLiteReadCache', 'cache_key', 'session_model', 'snapshot', 'restore',
+           'invalidate', 'has_pending_writes']
+
+_backends = []  #: all ReadCache instances, writes invalidate the entries in each of them
+
+
+class ReadCache(object):
+    """Base class of `Resource.read_cache` backends, storing snapshots of models
+    (see `snapshot`) by key string. `hits` and `misses` count the lookups of
+    this process.
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        _backends.append(self)
+
+    def get(self, key):
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': float(self.hits) / lookups if lookups else 0.0}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, keys):
+        raise NotImplementedError
+
+
+class LocalReadCache(ReadCache):
+    """In-process cache of at most `maxsize` entries, expiring after `ttl` seconds
+    """
+    def __init__(self, maxsize=1000, ttl=300):
+        super(LocalReadCache, self).__init__(ttl)
+        self._cache = LRUCache(maxsize, ttl)
+
+    def _get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def delete(self, keys):
+        for key in keys:
+            self._cache.delete(key)
+
+
+class SQLiteReadCache(ReadCache):
+    """Cache shared by the worker processes of a host, stored in SQLite database
+    file `path`. Entries expire after `ttl` seconds.
+    """
+    def __init__(self, path, ttl=300):
+        super(SQLiteReadCache, self).__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # sqlite3 connections can't be shared by threads
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = self._local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('CREATE TABLE IF NOT EXISTS read_cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+        return conn
+
+    def _get(self, key):
+        row = self.connection.execute('SELECT value, expires FROM read_cache WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return bytes(row[0])
+
+    def set(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO read_cache (key, value, expires) VALUES (?, ?, ?)',
+                                (key, sqlite3.Binary(value), time.time() + self.ttl))
+
+    def delete(self, keys):
+        self.connection.executemany('DELETE FROM read_cache WHERE key = ?', [(key,) for key in keys])
+
+    def purge(self):
+        """Removes expired entries
+        """
+        self.connection.execute('DELETE FROM read_cache WHERE expires < ?', (time.time(),))
+
+
+def _coerce_pk(mapper, pk):
+    try:
+        return mapper.primary_key[0].type.python_type(pk)
+    except (NotImplementedError, TypeError, ValueError):
+        return pk
+
+def cache_key(model_class, company_id, pk):
+    """Returns key of a model read by primary key `pk` for `company_id`.
+    `pk` is converted to the type of the primary key, so '5' and 5 share the key.
+    """
+    pk = _coerce_pk(orm.class_mapper(model_class), pk)
+    return '%s.%s:%s:%r' % (model_class.__module__, model_class.__name__, company_id, pk)
+
+def session_model(session, model_class, pk):
+    """Returns the `model_class` instance with primary key `pk` already present
+    in `session`, None if it isn't loaded. Reads should return it rather than
+    merging a snapshot over its possibly unflushed changes.
+    """
+    mapper = orm.class_mapper(model_class)
+    model = session.identity_map.get(mapper.identity_key_from_primary_key([_coerce_pk(mapper, pk)]))
+    return model if isinstance(model, model_class) else None
+
+def model_keys(model):
+    """Returns all keys `model` may be cached by: for each class of its
+    inheritance chain, with and without its `company_id`
+    """
+    mapper = orm.object_mapper(model)
+    pk = mapper.primary_key_from_instance(model)[0]
+    if pk is None:
+        return []
+
+    companies = set([None, getattr(model, 'company_id', None)])
+    return [cache_key(m.class_, company_id, pk) for m in mapper.iterate_to_root() for company_id in companies]
+
+def snapshot(model):
+    """Returns the loaded column values of a persistent, unmodified `model` as
+    pickled string, None if the model can't be cached
+    """
+    state = instance_state(model)
+    if not state.persistent or state.modified:
+        return None
+
+    values = dict((prop.key, state.dict[prop.key]) for prop in state.mapper.column_attrs if prop.key in state.dict)
+    return pickle.dumps((model.__class__, values), pickle.HIGHEST_PROTOCOL)
+
+def restore(value):
+    """Returns detached model of a `snapshot`, to be added to a session with
+    `Session.merge(model, load=False)`. Attributes missing in the snapshot are
+    loaded on access.
+    """
+    model_class, values = pickle.loads(value)
+    model = orm.class_mapper(model_class).class_manager.new_instance()
+    instance_state(model).dict.update(values)
+    orm.make_transient_to_detached(model)
+    return model
+
+
+def invalidate(session, models):
+    """Removes cached `models` from all backends, now and again when the
+    transaction of `session` ends, so reads of uncommitted data are not kept
+    """
+    if not _backends:
+        return
+
+    keys = [key for model in models for key in model_keys(model)]
+    if keys:
+        _delete(keys)
+        session.info.setdefault('read_cache_keys', []).extend(keys)
+
+def has_pending_writes(session):
+    """Returns True if the transaction of `session` has written cached models,
+    reads must not be cached until it ends
+    """
+    return bool(session.info.get('read_cache_keys'))
+
+def _delete(keys):
+    for backend in _backends:
+        backend.delete(keys)
+
+@event.listens_for(orm.Session, 'after_commit')
+@event.listens_for(orm.Session, 'after_rollback')
+def _end_transaction(session):
+    keys = session.info.pop('read_cache_keys', None)
+    if keys:
+        _delete(keys)
@@ -3,21 +3,108 @@ from core import threadlocal
 __author__ = 'Azharul'
 
 import sys
+import time
 import datetime
+import threading
 import collections
 import operator
+import itertools
+import functools
 import sqlalchemy
 import formencode
+from multiprocessing.pool import ThreadPool
+from sqlalchemy import event
+from sqlalchemy.ext import baked
+from sqlalchemy.util import KeyedTuple
+from django.conf import settings
 
 from core.model import Model
 from core.exceptions import ResourceInsertException
 from core.validators import ModelValidator
-from core.utils.datastructures import SortedDict
-from core.page import Page
+from core.utils.datastructures import SortedDict, LRUCache
+from core.page import Page, keyset_paginate
+from core.counting import exact_count
+from core.dbconfig import use_primary
+from core import readcache
+
+
+BulkResult = collections.namedtuple('BulkResult', 'keys errors')
+
+
+def _on_primary(method):
+    """Runs all statements of a write method on the primary database, see `core.dbconfig.RoutingSession`
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with use_primary(self.session):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+_validators = {}    #: Validator instances, by (Resource class, validate_with[, fields])
+
+bakery = baked.bakery(size=500)  #: Compiled `read`, `paginate` and `named` queries, by model and criteria
+
+lookup_cache = LRUCache(maxsize=256, ttl=300)   #: findDict/option_list results, by (base mapper, Resource class, company_id, ...)
+
+
+def _delete_lookups(base_mappers):
+    lookup_cache.delete_matching(lambda key: key[0] in base_mappers)
+
+@event.listens_for(sqlalchemy.orm.Session, 'after_commit')
+@event.listens_for(sqlalchemy.orm.Session, 'after_rollback')
+def _end_lookup_transaction(session):
+    # lookups read back before the transaction ended may hold its uncommitted writes
+    base_mappers = session.info.pop('lookup_mappers', None)
+    if base_mappers:
+        _delete_lookups(base_mappers)
+
+
+Gathered = collections.namedtuple('Gathered', 'value seconds')
+
+_propagated_state = ('user', 'request', 'company_id')  #: thread local state copied to `Resource.gather` workers
+_gather_pool = None
+_gather_lock = threading.Lock()
+
+def gather_pool():
+    """Thread pool running `Resource.gather` calls, created on first use with
+    `GATHER_MAX_WORKERS` setting (default 8) threads. Should be smaller than
+    the database connection pool, see `core.dbconfig.pool_options`.
+    """
+    global _gather_pool
+    with _gather_lock:
+        if _gather_pool is None:
+            _gather_pool = ThreadPool(getattr(settings, 'GATHER_MAX_WORKERS', 8))
+    return _gather_pool
+
+def _gather_call(resource_class, call, state):
+    start = time.time()
+    for k, v in state.items():
+        threadlocal.set(k, v)
+    try:
+        value = call(resource_class())
+    finally:
+        session = threadlocal.get('session')
+        if session is not None:
+            session.remove()
+        threadlocal.cleanup()
+    return Gathered(value, time.time() - start)
+
+
+def _page_slice(query):
+    return query.limit(sqlalchemy.bindparam('limit')).offset(sqlalchemy.bindparam('offset'))
+
+
+def _chunks(items, size=500):
+    """Splits `items` into lists of `size`, keeps IN clauses below the bind parameter limit
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 
 class Resource(object):
-    """Used for database read/write operation
+    """Used for database read/write operation. With replicas configured, reads
+    (`query`, `read`, `paginate`, `findDict`, `group_by`, ...) are served by a
+    replica and writes by the primary database, see `core.dbconfig.RoutingSession`
 
     Requires the subclasses to declare `mapper` and `validators` to be used with Resource::
 
@@ -26,6 +113,11 @@ class Resource(object):
             validate_with = UserValidation
             validators = [UserUpdateValidation]
     """
+    count_strategy = exact_count    #: Counts records in `paginate`, see `core.counting`
+    cache_lookups = False           #: If True, `findDict`/`option_list` results are cached in `lookup_cache`
+    bake_queries = True             #: If True, `read` and `paginate` use compiled queries from `bakery`
+    named_queries = {}              #: name: function(query, model) adding criteria, see `Resource.named`
+    read_cache = None               #: Optional `core.readcache.ReadCache` backend caching `read(pk)` results
 
     def __init__(self):
         self.session = threadlocal.db_session()    #: Current sqlalchemy session
@@ -34,8 +126,7 @@ class Resource(object):
             self._vindex = dict((v.__name__, v) for v in getattr(self, 'validators', ()))
             self._qindex = dict((q.__name__, q) for q in getattr(self, 'query_builders', ()))
             self._to_delete = []
-            self._to_empty = []
-            self._to_append = []
+            self._to_link = []
 
 
     @property
@@ -60,30 +151,40 @@ class Resource(object):
 
     def create_validator(self, validate_with=None, **kw):
         """Creates a Validation object, using the default validator, or one of the
-        validators available in the `validators` list of `Dao`.
+        validators available in the `validators` list of `Dao`. The object is
+        created once per Resource class and reused, callable defaults are
+        evaluated on every validation.
 
         :param validate_with: Optional, Validation class to use
 
         :return: `Validation` object
         """
-        return self._vindex.get(validate_with, self.validate_with)()
+        key = (self.__class__, validate_with)
+        if key not in _validators:
+            _validators[key] = self._vindex.get(validate_with, self.validate_with)()
+
+        return _validators[key]
 
     def create_partial_validator(self, fields, validate_with=None, **kw):
         """Creates a new validator with the given `fields`, which are taken from
         the the default validator, or one of the validators available in the
-        `validators` list of `Dao`.
+        `validators` list of `Dao`. Cached per Resource class and set of `fields`.
 
         :param fields: List of fields to use in the created validator
         :param validate_with: Optional, Validation class to use
 
         :return: `Validation` object
         """
-        validator = self._vindex.get(validate_with, self.validate_with)
-        partial_validator = ModelValidator()
-        for name in fields:
-            if name in validator.fields:
-                partial_validator.add_field(name, validator.fields[name])
-        return partial_validator
+        key = (self.__class__, validate_with, frozenset(fields))
+        if key not in _validators:
+            validator = self._vindex.get(validate_with, self.validate_with)
+            partial_validator = ModelValidator()
+            for name in fields:
+                if name in validator.fields:
+                    partial_validator.add_field(name, validator.fields[name])
+            _validators[key] = partial_validator
+
+        return _validators[key]
 
 
     def submitted_data(self, data):
@@ -156,58 +257,93 @@ class Resource(object):
 
         :return: `model`
         """
+        plan = _write_plan(mapper)
         for k, v in data.iteritems():
-            try:
-                prop = mapper.get_property(k)
-            except Exception as e:
-                print(e)
-            if prop is None: continue
-
-            if isinstance(prop, sqlalchemy.orm.RelationshipProperty):
-                pk = prop.mapper.primary_key[0].key
-                related_class = prop.mapper.class_
-                # map of related objects, in {fk: fk_value} format
-                if prop.direction is sqlalchemy.orm.interfaces.MANYTOMANY:
-                    # flag existing models to be removed
-                    self._to_empty.append(getattr(model, k))
-                    # add new items
-                    right_fk = prop.secondaryjoin.right.name
-                    for inner_dict in v:
-                        right_model = self.session.query(related_class).get(inner_dict[right_fk])
-                        if right_model:
-                            self._to_append.append((getattr(model, k), right_model))
-                # map of related objects, in {id: data_dict} format
-                elif prop.uselist:
-                    related_models = dict((getattr(inner, pk), inner) for inner in getattr(model, prop.key))
-                    for inner_dict in v:
-                        id = inner_dict.get(pk)
-                        if id:
-                            self._update(prop.mapper, inner_dict, related_models[id])
-                            del related_models[id]
-                        else:
-                            getattr(model, k).append(self._update(prop.mapper, inner_dict, related_class()))
-
-                    # flag non-updated related models for deletion
-                    self._to_delete.extend(related_models.values())
-                else:
-                    # TODO: Not too well tested
-                    related_model = getattr(model, prop.key)
-                    if related_model and v:
-                        if v.get(pk):
-                            self._update(prop.mapper, v, related_model)
-                        else:
-                            self._to_delete.append(related_model)
-                    # don't create the related object if None is provided instead of a dictionary
-                    elif v != None:
-                        setattr(model, k, self._update(prop.mapper, v, related_class()))
-                    if v == None and related_model:
-                        self._to_delete.append(related_model)
-            else:
-                setattr(model, k, v)
+            if k in plan:
+                handler, prop = plan[k]
+                handler(self, mapper, model, prop, v)
 
         self._post_process(model)
         return model
 
+    def _update_column(self, mapper, model, prop, value):
+        setattr(model, prop.key, value)
+
+    def _update_many_to_many(self, mapper, model, prop, value):
+        """map of related objects, in {fk: fk_value} format. Association rows are
+        diffed against the database in `_post_write`
+        """
+        right_fk = prop.secondaryjoin.right.name
+        self._to_link.append((mapper, model, prop, set(inner_dict[right_fk] for inner_dict in value)))
+
+    def _update_list(self, mapper, model, prop, value):
+        """map of related objects, in {id: data_dict} format
+        """
+        pk = prop.mapper.primary_key[0].key
+        collection = getattr(model, prop.key)
+        related_models = dict((getattr(inner, pk), inner) for inner in collection)
+        for inner_dict in value:
+            id = inner_dict.get(pk)
+            if id:
+                self._update(prop.mapper, inner_dict, related_models[id])
+                del related_models[id]
+            else:
+                collection.append(self._update(prop.mapper, inner_dict, prop.mapper.class_()))
+
+        # flag non-updated related models for deletion
+        self._to_delete.extend(related_models.values())
+
+    def _update_scalar(self, mapper, model, prop, value):
+        # TODO: Not too well tested
+        pk = prop.mapper.primary_key[0].key
+        related_model = getattr(model, prop.key)
+        if related_model and value:
+            if value.get(pk):
+                self._update(prop.mapper, value, related_model)
+            else:
+                self._to_delete.append(related_model)
+        # don't create the related object if None is provided instead of a dictionary
+        elif value != None:
+            setattr(model, prop.key, self._update(prop.mapper, value, prop.mapper.class_()))
+        if value == None and related_model:
+            self._to_delete.append(related_model)
+
+    def _sync_many_to_many(self, enable_delete=False):
+        """Brings the association rows of every many-to-many field collected by
+        `_update` in line with the submitted keys. Current keys are read from the
+        association table and only the difference is written, as one INSERT
+        (executemany) and one DELETE per field. Submitted keys are read back
+        from the related table first, so they are compared in the column's type
+        ('2' matches 2); keys not existing in the related table are ignored.
+
+        :param enable_delete: Optional, if True, association rows absent in data are deleted
+        """
+        while self._to_link:
+            mapper, model, prop, submitted = self._to_link.pop(0)
+            (parent_column, left), = prop.synchronize_pairs
+            (target_column, right), = prop.secondary_synchronize_pairs
+            left_value = getattr(model, mapper.get_property_by_column(parent_column).key)
+
+            current = set(row[0] for row in self.session.execute(
+                sqlalchemy.select([right]).where(left == left_value)))
+
+            valid = set()
+            for keys in _chunks(list(submitted)):
+                query = sqlalchemy.select([target_column]).where(target_column.in_(keys))
+                valid.update(row[0] for row in self.session.execute(query))
+
+            to_insert = [{left.key: left_value, right.key: key} for key in valid - current]
+            if to_insert:
+                self.session.execute(prop.secondary.insert(), to_insert)
+
+            to_delete = list(current - valid) if enable_delete else []
+            for keys in _chunks(to_delete):
+                self.session.execute(prop.secondary.delete().where(left == left_value).where(right.in_(keys)))
+
+            # collection was modified behind the ORM's back
+            if to_insert or to_delete:
+                self.session.expire(model, [prop.key])
+
     def _post_process(self, model):
         """Applies common changes to the model created from validated data
 
@@ -222,15 +358,19 @@ class Resource(object):
             model.created = model.updated
             model.created_by = model.updated_by
 
-    def _post_write(self, model, commit=False):
-        while self._to_append:
-            collection, related_model = self._to_append.pop(0)
-            if related_model not in collection:
-                collection.append(related_model)
+    def _post_write(self, model, commit=False, enable_delete=False):
+        written = list(self.session.new) + list(self.session.dirty) + list(self.session.deleted)
+        # primary keys of new models are needed for the association rows
+        self.session.flush()
+        self._sync_many_to_many(enable_delete)
+        self._invalidate_lookups()
+        readcache.invalidate(self.session, written)
 
-        self._commit() if commit else self.session.flush()
+        if commit:
+            self._commit()
         return model
 
+    @_on_primary
     def create(self, data, validate_with=None, commit=False, **kw):
         """Creates a new object after validating `data` and saves it to database.
 
@@ -244,6 +384,110 @@ class Resource(object):
         self.session.add(model)
         return self._post_write(model, commit)
 
+    @_on_primary
+    def bulk_create(self, rows, chunk_size=500, validate_with=None, commit=False, return_keys=True, **kw):
+        """Validates a list of `rows` and inserts the valid ones in chunks, using
+        one multi-row INSERT (or executemany, see `return_keys`) per chunk and mapper
+        instead of flushing every model. Invalid rows are reported in `errors`.
+        Every row is validated and stamped the same way `create` does it, but only
+        column attributes are written, nested relationships are ignored::
+
+            result = dao.bulk_create([{'Party': {...}}, {'Party': {...}}])
+            result.keys    # [1, 2, None, ...]
+            result.errors  # {2: ResourceInsertException}
+
+        :param rows: List of data dictionaries, each one in the format accepted by `create`
+        :param chunk_size: Optional, number of rows inserted per statement
+        :param validate_with: Optional, Validation class to use
+        :param commit: Optional, commits the transaction if `True` is used
+        :param return_keys: Optional, if False primary keys aren't read back, which lets
+                            databases without RETURNING (SQLite, MySQL) insert a chunk
+                            with a single executemany instead of one INSERT per row
+
+        :return: `BulkResult` with list of primary keys (`None` for invalid rows, and
+                 for all rows if `return_keys` is False) and dict of `ResourceInsertException`
+                 by row index
+        """
+        validator = self.create_validator(validate_with, **kw)
+        result = BulkResult([None] * len(rows), {})
+        for start in range(0, len(rows), chunk_size):
+            chunk = collections.OrderedDict()
+            for index in range(start, min(start + chunk_size, len(rows))):
+                try:
+                    field_dict, namespace = self.submitted_data(rows[index])
+                except KeyError as e:
+                    invalid = formencode.Invalid(e.args[0], rows[index], None, error_dict={self.model.__name__: {}})
+                    result.errors[index] = ResourceInsertException(invalid, self)
+                    continue
+
+                try:
+                    cleaned_data = validator.to_python(field_dict)
+                except formencode.Invalid as e:
+                    e.error_dict = {namespace: e.error_dict or {}}
+                    result.errors[index] = ResourceInsertException(e, self)
+                    continue
+
+                mapper = self.mapper.polymorphic_map.get(cleaned_data.get(self.polymorphic_key), self.mapper)
+                chunk.setdefault(mapper, []).append((index, self._bulk_mapping(mapper, cleaned_data)))
+
+            for mapper, records in chunk.iteritems():
+                for index, pk in self._bulk_insert(mapper, records, return_keys):
+                    result.keys[index] = pk
+
+        self._invalidate_lookups()
+        if commit:
+            self._commit()
+        return result
+
+    def _bulk_mapping(self, mapper, data):
+        """Returns column values of `mapper` from validated `data`, stamped by
+        `_post_process`, in {attribute: value} format
+        """
+        model = mapper.class_()
+        for prop in mapper.column_attrs:
+            if prop.key in data:
+                setattr(model, prop.key, data[prop.key])
+
+        self._post_process(model)
+        return dict((prop.key, model.__dict__[prop.key]) for prop in mapper.column_attrs if prop.key in model.__dict__)
+
+    def _bulk_insert(self, mapper, records, return_keys=True):
+        """Inserts `records`, list of (index, mapping) pairs, of a single mapper
+        and yields (index, primary key) pairs.
+
+        Dialects supporting RETURNING get a single INSERT per distinct set of keys.
+        Others (and joined table inheritance) go through `Session.bulk_insert_mappings`,
+        which executes one INSERT per row to read the generated keys, or a single
+        executemany if `return_keys` is False.
+        """
+        pk = mapper.primary_key[0]
+        dialect = self.session.get_bind(mapper).dialect
+
+        if dialect.implicit_returning and mapper.local_table is mapper.base_mapper.local_table:
+            # rows of a multi-row INSERT must share the same columns
+            groups = collections.OrderedDict()
+            for index, mapping in records:
+                groups.setdefault(frozenset(mapping), []).append((index, mapping))
+
+            for group in groups.itervalues():
+                values = [dict((mapper.get_property(k).columns[0].key, v) for k, v in mapping.iteritems())
+                          for index, mapping in group]
+                statement = mapper.local_table.insert().values(values).returning(pk)
+                pks = [row[0] for row in self.session.execute(statement, mapper=mapper)]
+                for (index, mapping), value in itertools.izip(group, pks):
+                    yield index, value
+        elif not return_keys:
+            self.session.bulk_insert_mappings(mapper, [mapping for index, mapping in records])
+            for index, mapping in records:
+                yield index, None
+        else:
+            mappings = [mapping for index, mapping in records]
+            self.session.bulk_insert_mappings(mapper, mappings, return_defaults=True)
+            pk_key = mapper.get_property_by_column(pk).key
+            for (index, _), mapping in itertools.izip(records, mappings):
+                yield index, mapping.get(pk_key)
+
+    @_on_primary
     def update(self, data, models, validate_with=None, enable_delete=False, commit=False, **kw):
         """Updates a single model or a list of models from `data`.
 
@@ -265,16 +509,21 @@ class Resource(object):
         if enable_delete:
             while self._to_delete:
                 self.session.delete(self._to_delete.pop(0))
-            # unlink many-to-many relations
-            while self._to_empty:
-                collection = self._to_empty.pop(0)
-                # doesn't work if we don't copy the list first
-                for related_model in collection[:]:
-                    collection.remove(related_model)
 
         # return models in its original shape
-        return self._post_write(models, commit)
+        return self._post_write(models, commit, enable_delete)
+
+
+    @_on_primary
+    def delete(self, models, commit=False):
+        """Deletes a single model or a list of models.
+
+        :param commit: Optional, commits the transaction if `True` is used
+        """
+        for model in (models if isinstance(models, collections.Sequence) else [models]):
+            self.session.delete(model)
 
+        self._post_write(models, commit)
 
     def _commit(self):
         """Commits the transaction, in case of an exception performs rollback
@@ -291,15 +540,28 @@ class Resource(object):
 
         :param query: Optional, query for reading models. If not provided, all models will be read
         :param container: Optional, container class to used for groups. Uses `dict` by default
+        :param batch_size: Optional, reads the rows from the cursor in batches of `batch_size` (`Query.yield_per`).
+                           Models are kept in the groups and stay attached to the session, so this
+                           reduces driver buffering only; use `lazy` to bound memory use
+        :param lazy: Optional, if True, groups are built in SQL from the keys and primary keys only,
+                     see `LazyGroup`. `all` and the models of a group are read on first access
+        :param columns: Optional, with `lazy`, additional columns to read for `LazyGroup.rows`
 
         :return: Group object, containing list property for every grouped key and `all` objects
         """
         container = kwargs.get('container', dict)
-        groups = collections.namedtuple('Groups', 'all ' + ' '.join(args))((kwargs.get('query') or self.query()).all(), *[container() for _ in range(len(args))])
+        query = kwargs.get('query') or self.query()
+        batch_size = kwargs.get('batch_size')
+
+        if kwargs.get('lazy'):
+            return self._lazy_group_by(query, args, kwargs.get('columns', ()))
+
+        groups = collections.namedtuple('Groups', 'all ' + ' '.join(args))([], *[container() for _ in range(len(args))])
+        keys = [(key, key != self.primary_key, getattr(groups, key)) for key in args]
 
-        for key, uselist in [(key, key != self.primary_key) for key in args]:
-            group = getattr(groups, key)
-            for model in groups.all:
+        for model in (query.yield_per(batch_size) if batch_size else query.all()):
+            groups.all.append(model)
+            for key, uselist, group in keys:
                 value = getattr(model, key)
                 if uselist:
                     group.setdefault(value, []).append(model)
@@ -308,6 +570,25 @@ class Resource(object):
 
         return groups
 
+    def _lazy_group_by(self, query, keys, columns):
+        """Groups by `keys` with a single ordered scan of the key, primary key and
+        `columns` values, without loading models
+        """
+        pk = self.primary_key
+        columns = [getattr(self.model, c) if isinstance(c, str) else c for c in columns]
+        scan = query.with_entities(*([getattr(self.model, key) for key in keys] + [getattr(self.model, pk)] + columns)) \
+                    .order_by(None).order_by(getattr(self.model, pk))
+
+        groups = [(key, collections.OrderedDict()) for key in keys]
+        for row in scan:
+            for key, rows in groups:
+                rows.setdefault(getattr(row, key), []).append(row)
+
+        return collections.namedtuple('Groups', 'all ' + ' '.join(keys))(
+            LazyList(query),
+            *[LazyGroup(self, query, rows, key != pk) for key, rows in groups]
+        )
+
     def all(self, **kwargs):
         """Reads all objects which are mapped by the Dao's mapper. All keyword
         arguments are passed to `Dao.query`
@@ -317,6 +598,129 @@ class Resource(object):
         return self.query(**kwargs).all()
 
 
+    def iter(self, query=None, batch_size=1000, **kwargs):
+        """Iterates over `query` (or all models, keyword arguments are passed to
+        `Dao.query`) in batches of `batch_size` rows, using a server side cursor
+        where the database driver supports it. Models of a batch are expunged
+        from the session once the next batch is read, so memory use is bounded
+        by `batch_size` instead of the size of the result.
+
+        Expunged models are detached, their unloaded attributes can't be read.
+        Eager loading of collections can't be used with the query.
+
+        :return: Generator of objects (or rows, for a query of columns)
+        """
+        query = (query or self.query(**kwargs)).yield_per(batch_size)
+
+        batch = []
+        for row in query:
+            if len(batch) == batch_size:
+                self._expunge(batch)
+                batch = []
+            if isinstance(row, Model):
+                batch.append(row)
+            yield row
+
+        self._expunge(batch)
+
+    def iter_rows(self, *args, **kwargs):
+        """Iterates over rows of the given columns in batches, see `Resource.iter`.
+        Columns are passed to `Dao.query` along with the keyword arguments::
+
+            for id, name in dao.iter_rows('id', 'name', batch_size=5000):
+                ...
+        """
+        batch_size = kwargs.pop('batch_size', 1000)
+        return self.iter(self.query(*args, **kwargs), batch_size)
+
+    def rows(self, *args, **kwargs):
+        """Reads the given columns as light weight named tuples, skipping ORM
+        object loading and identity map. The row class is generated once per
+        Model and set of columns. Columns and keyword arguments are passed to
+        `Dao.query`, so the tenant filter is applied::
+
+            for row in dao.rows('id', 'name', 'amount', party_id=10):
+                row.id, row.name, row.amount
+
+        :param query: Optional, query to read the columns from, instead of a new `Dao.query`
+
+        :return: List of named tuples
+        """
+        query = kwargs.pop('query', None)
+        columns = [getattr(self.model, f) if isinstance(f, str) else f for f in args]
+        query = query.with_entities(*columns) if query is not None else self.query(*columns, **kwargs)
+
+        row_class = _row_class(self.model, tuple(getattr(c, 'key', None) or str(c) for c in columns))
+        return [row_class._make(row) for row in self.session.execute(query.statement)]
+
+    def gather(self, *calls, **kwargs):
+        """Runs independent read-only `calls` in parallel on the `gather_pool`
+        threads, so a dashboard takes as long as its slowest query. Each call
+        receives a new Resource of the same class, with its own session and the
+        current user (so `company_id` filtering applies)::
+
+            totals, counts = dao.gather(
+                lambda r: r.query(sqlalchemy.func.sum(Invoice.amount)).scalar(),
+                lambda r: r.query().count())
+
+        Calls may create other Resources too, they share the worker's session.
+        The worker's session is closed when its call returns, so calls should
+        return values, rows or models with all needed attributes loaded.
+
+        :param timeout: Optional, seconds to wait for all results, in total. When it
+                        expires `multiprocessing.TimeoutError` is raised, but calls still
+                        running aren't interrupted: they keep their worker and database
+                        connection until they return.
+
+        :return: List of `Gathered` (value, seconds) in the order of `calls`.
+                 The first exception raised by a call is re-raised.
+        """
+        timeout = kwargs.pop('timeout', None)
+        deadline = time.time() + timeout if timeout is not None else None
+        state = dict((k, threadlocal.get(k)) for k in _propagated_state)
+        results = [gather_pool().apply_async(_gather_call, (self.__class__, call, state)) for call in calls]
+        return [result.get(max(deadline - time.time(), 0) if deadline is not None else None) for result in results]
+
+    def prefetch_generic(self, models, relation, types=None):
+        """Loads the `GenericRelation` objects of all `models` with a single
+        `table_key IN (...)` query, so that iterating and `all`, `first`, `count`
+        of the relation and `default` of its ListProperties don't query per model::
+
+            page = dao.paginate(limit=100)
+            dao.prefetch_generic(page.rows, 'addresses', types=['billing'])
+            for party in page.rows:
+                party.addresses.billing.default
+
+        :param models: List of models of the Resource
+        :param relation: Name of the GenericRelation property
+        :param types: Optional, `type` values to load, for prefetching only some of the ListProperties
+
+        :return: `models`
+        """
+        if not models:
+            return models
+
+        views = [getattr(model, relation) for model in models]
+        related_class = views[0].related_class
+        query = self.session.query(related_class).filter(views[0].owner_filter())
+        if types is not None:
+            query = query.filter(related_class.type.in_(types))
+
+        related = collections.defaultdict(list)
+        for keys in _chunks(list(set(model.id for model in models))):
+            for obj in query.filter(related_class.table_key.in_(keys)).order_by(related_class.id):
+                related[obj.table_key].append(obj)
+
+        for view in views:
+            view.prefetch(related.get(view.model.id, []), types)
+
+        return models
+
+    def _expunge(self, models):
+        for model in models:
+            if model in self.session:
+                self.session.expunge(model)
+
     def query(self, *args, **kwargs):
         """Creates an SQLAlchemy query object for the model of Dao. The columns
         to read can be specified via variable number of positional arguments,
@@ -341,7 +745,7 @@ class Resource(object):
         branch = kwargs.pop('branch', False)
         deleted = kwargs.pop('deleted', False)
 
-        if self.user and self.user.company_id and hasattr(self.model, 'company_id'):
+        if self._tenant_id() is not None:
             query = query.filter(self.model.company_id == self.user.company_id)
 
         #if branch and self.user and hasattr(self.model, 'branch_id'):
@@ -352,24 +756,124 @@ class Resource(object):
             query = query.filter_by(**kwargs)
         return query
 
-    def paginate(self, query=None, page=1, limit=None, count_query=None, count=None):
+    def _tenant_id(self):
+        """Returns `company_id` the queries are filtered by, None if not filtered
+        """
+        if self.user and self.user.company_id and hasattr(self.model, 'company_id'):
+            return self.user.company_id
+        return None
+
+    def baked_query(self):
+        """Returns `BakedQuery` for the model, filtered by the tenant like
+        `Dao.query`. Criteria added to it are compiled once per model, values
+        must be given as bind parameters, see `Resource.baked_result`
+        """
+        model = self.model
+        bq = bakery(lambda session: session.query(model), model)
+        if self._tenant_id() is not None:
+            bq += lambda query: query.filter(model.company_id == sqlalchemy.bindparam('company_id'))
+        return bq
+
+    def baked_result(self, bq, **params):
+        """Returns `bq` result for the session, with the tenant and `params` bind parameters
+        """
+        company_id = self._tenant_id()
+        if company_id is not None:
+            params['company_id'] = company_id
+
+        # baked queries need the Session itself, not the scoped_session proxy
+        session = self.session.registry() if isinstance(self.session, sqlalchemy.orm.scoped_session) else self.session
+        return bq(session).params(**params)
+
+    def named(self, name, **params):
+        """Runs the named query `name`, declared in `named_queries` as function
+        adding criteria to the model query. Values are given as bind parameters::
+
+            class CurrencyResource(Resource):
+                named_queries = {
+                    'by_code': lambda query, model: query.filter(model.code == sqlalchemy.bindparam('code')),
+                }
+
+            dao.named('by_code', code='USD').first()
+
+        :return: `sqlalchemy.ext.baked.Result`, supports `all`, `first`, `one` and iteration
+        """
+        criteria, model = self.named_queries[name], self.model
+        bq = self.baked_query().with_criteria(lambda query: criteria(query, model), criteria)
+        return self.baked_result(bq, **params)
+
+    def paginate(self, query=None, page=1, limit=None, count_query=None, count=None, cursor=None, order_by=None,
+                 window_count=False):
         """
         :param query: sqlalchemy query object
         :param page: page no
         :param count_query: optional count query, default is None
         :param limit: number of rows in a page
+        :param cursor: Optional, cursor of a previous `CursorPage`, switches to keyset pagination
+        :param order_by: Optional, list of columns for keyset pagination, switches to keyset pagination.
+                         Primary key is always appended. See `core.page.keyset_paginate`
+        :param window_count: Optional, if True, reads the rows and `COUNT(*) OVER ()` in a single query.
+                             If the page is empty, records are counted by `count_query` or
+                             `count_strategy` and the page is returned without rows, also when
+                             it is out of range.
+
+        Records are counted by `count_strategy`, see `core.counting`
 
-        :return: Page object with page no, limit, records and rows
+        :return: Page object with page no, limit, records and rows, or CursorPage for keyset pagination
         """
+        bake = query is None and self.bake_queries
         query = query or self.query()
-        records = count if count is not None else (count_query or query).count()
+        if cursor is not None or order_by is not None:
+            return keyset_paginate(query, order_by or (), getattr(self.model, self.primary_key), cursor,
+                                   limit if type(limit) == int else None)
 
         if type(limit) != int:
             limit = None
 
-        page = Page(page, limit, records)
+        if window_count and count is None:
+            window_page = self._paginate_window(query, page, limit)
+            if window_page is not None:
+                return window_page
+
+            # the rows were read already, only the count is missing
+            return Page(page, limit, *self.count_strategy(count_query or query))
+
+        if count is not None:
+            records, exact = count, True
+        else:
+            records, exact = self.count_strategy(count_query or query)
+
+        page = Page(page, limit, records, exact)
         offset = (page.page - 1) * page.limit
-        page.rows = query.limit(page.limit).offset(offset).all()
+        if bake:
+            bq = self.baked_query().with_criteria(_page_slice)
+            page.rows = self.baked_result(bq, limit=page.limit, offset=offset).all()
+        else:
+            page.rows = query.limit(page.limit).offset(offset).all()
+        return page
+
+    def _paginate_window(self, query, page, limit):
+        """Reads a page of `query` along with the total number of records, using
+        `COUNT(*) OVER ()` window function (SQLite 3.25+, PostgreSQL, MySQL 8).
+
+        :return: Page object, or None if the page is empty (no records, or page out of range)
+        """
+        page_no = max(int(page), 1)
+        single_entity = len(query.column_descriptions) == 1
+        query = query.add_columns(sqlalchemy.func.count().over().label('_records'))
+        if limit:
+            query = query.limit(limit).offset((page_no - 1) * limit)
+
+        rows = query.all()
+        if not rows:
+            return None
+
+        page = Page(page_no, limit, rows[0][-1])
+        if single_entity:
+            page.rows = [row[0] for row in rows]
+        else:
+            labels = rows[0].keys()[:-1]
+            page.rows = [KeyedTuple(row[:-1], labels) for row in rows]
         return page
 
     # Migrated from old dao
@@ -377,23 +881,82 @@ class Resource(object):
         """Reads a model from database, by primary key. Additional keyword arguments
         are passed to `Dao.query`.
 
+        Without keyword arguments the compiled query is reused, see `bake_queries`,
+        and the model is served from `read_cache` if the Resource has one::
+
+            class CurrencyResource(Resource):
+                mapper = currency_mapper
+                read_cache = LocalReadCache(maxsize=500, ttl=600)
+
+        A model already in the session is returned as it is. Misses are read
+        from the primary, and aren't cached while the transaction has uncommitted writes.
+
         :param pk: Primary key value
 
         :return: Model if model is found, otherwise None
         """
-        query = self.query(**kwargs).filter(getattr(self.model, self.primary_key) == pk)
+        if self.read_cache is None or kwargs:
+            return self._read(pk, **kwargs)
+
+        company_id = self._tenant_id()
+        model = readcache.session_model(self.session, self.model, pk)
+        if model is not None:
+            if company_id is None or model.company_id == company_id:
+                return model
+            return None
+
+        key = readcache.cache_key(self.model, company_id, pk)
+        cached = self.read_cache.get(key)
+        if cached is not None:
+            return self.session.merge(readcache.restore(cached), load=False)
+
+        # filled from the primary, a replica may still have the row invalidated by a write
+        with use_primary(self.session):
+            model = self._read(pk)
+        if model is not None and not readcache.has_pending_writes(self.session):
+            value = readcache.snapshot(model)
+            if value is not None:
+                self.read_cache.set(key, value)
+        return model
+
+    def _read(self, pk, **kwargs):
+        column = getattr(self.model, self.primary_key)
+        if self.bake_queries and not kwargs:
+            bq = self.baked_query().with_criteria(lambda query: query.filter(column == sqlalchemy.bindparam('pk')))
+            return self.baked_result(bq, pk=pk).first()
+
+        query = self.query(**kwargs).filter(column == pk)
         return query.first()
 
     # Migrated from old dao
-    def findDict(self, query=None, key=None, value=None, empty_value=None, empty_text=''):
+    def findDict(self, query=None, key=None, value=None, empty_value=None, empty_text='', batch_size=None):
         """
 
         :param query: Optional, query for reading models. If not provided, all models will be read
         :param key: Optional, attribute to use as dictionary key
         :param value: Optional, attribute to use as dictionary value, if not provided uses the whole model as value
+        :param batch_size: Optional, streams the rows via `Resource.iter` instead of reading all at once
+
+        If `cache_lookups` is enabled, results for a `value` attribute without a
+        custom `query` are served from `lookup_cache`.
 
         :return: Dict of object with id as KEY and the row as VALUE
         """
+        cache_key = self._lookup_key('dict', query, key, value)
+        result = lookup_cache.get(cache_key) if cache_key else None
+        if result is None:
+            result = self._find_dict(query, key, value, batch_size)
+            if cache_key and not self.session.info.get('lookup_mappers'):
+                lookup_cache.set(cache_key, result)
+
+        if cache_key:
+            result = result.copy()
+        if empty_value is not None:
+            result.insert(0, empty_value, empty_text)
+
+        return result
+
+    def _find_dict(self, query, key, value, batch_size):
         keygetter = operator.attrgetter(key or self.primary_key)
         key_property = keygetter(self.model)
 
@@ -412,11 +975,136 @@ class Resource(object):
                 pass
 
         query = query or self.query()
-        result = SortedDict((keygetter(row), valuegetter(row) if value else row) for row in query.all())
-        if empty_value is not None:
-            result.insert(0, empty_value, empty_text)
-
-        return result
+        rows = self.iter(query, batch_size) if batch_size else query.all()
+        return SortedDict((keygetter(row), valuegetter(row) if value else row) for row in rows)
 
     def option_list(self, query=None, key=None, value=None, empty_value=None, empty_text=''):
-        return [dict(id=key,text=value) for key,value in self.findDict(query=query, key=key, value=value, empty_value=empty_value, empty_text=empty_text).iteritems()]
\ No newline at end of file
+        cache_key = self._lookup_key('options', query, key, value, empty_value, empty_text)
+        options = lookup_cache.get(cache_key) if cache_key else None
+        if options is None:
+            options = [dict(id=key,text=value) for key,value in self.findDict(query=query, key=key, value=value, empty_value=empty_value, empty_text=empty_text).iteritems()]
+            if cache_key and not self.session.info.get('lookup_mappers'):
+                lookup_cache.set(cache_key, options)
+
+        return list(options)
+
+    def _lookup_key(self, kind, query, *args):
+        """Returns `lookup_cache` key of a lookup, None if the lookup can't be cached.
+        Only lookups of plain values (not models) with the default query are cached.
+        """
+        if not self.cache_lookups or query is not None or args[1] is None:
+            return None
+
+        # Resources of the same mapper may override `query`, so results are kept per Resource class
+        return (self.mapper.base_mapper, self.__class__, getattr(self.user, 'company_id', None), kind) + args
+
+    def _invalidate_lookups(self):
+        """Removes cached lookups of the Model, called after every write. They are
+        removed again when the transaction ends, and no lookups are cached until then.
+        """
+        base_mapper = self.mapper.base_mapper
+        _delete_lookups(set([base_mapper]))
+        self.session.info.setdefault('lookup_mappers', set()).add(base_mapper)
+
+
+class LazyList(collections.Sequence):
+    """List of the models of `query`, read on first access
+    """
+    def __init__(self, query):
+        self.query = query
+        self._models = None
+
+    @property
+    def models(self):
+        if self._models is None:
+            self._models = self.query.all()
+        return self._models
+
+    def __getitem__(self, index):
+        return self.models[index]
+
+    def __len__(self):
+        return len(self.models)
+
+
+class LazyGroup(collections.Mapping):
+    """Group of `Resource.group_by` in lazy mode, {key value: models} mapping
+    holding only the primary keys (and optional columns) of each group. Models
+    of a group are read with a single IN query when the group is accessed::
+
+        groups = dao.group_by('party_id', lazy=True)
+        groups.party_id.rows(10)    # [(party_id, id), ...], no models read
+        groups.party_id[10]         # [<Invoice>, ...]
+    """
+    def __init__(self, resource, query, rows, uselist=True):
+        self.resource = resource
+        self.query = query
+        self.uselist = uselist
+        self._rows = rows
+        self._models = {}
+
+    def rows(self, value):
+        """Returns key, primary key and optional column values of the group, as
+        list of named tuples
+        """
+        return self._rows[value]
+
+    def __getitem__(self, value):
+        if value not in self._models:
+            pk = self.resource.primary_key
+            pk_column = getattr(self.resource.model, pk)
+            pks = [getattr(row, pk) for row in self._rows[value]]
+
+            loaded = {}
+            for keys in _chunks(pks):
+                loaded.update((getattr(model, pk), model) for model in self.query.filter(pk_column.in_(keys)))
+
+            models = [loaded[key] for key in pks if key in loaded]
+            self._models[value] = models if self.uselist else (models[0] if models else None)
+
+        return self._models[value]
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+
+_row_classes = {}   #: Row classes of `Resource.rows`, by (model, column names)
+
+
+def _row_class(model, names):
+    """Returns the named tuple class for rows of `names` columns of `model`,
+    created on first use
+    """
+    key = (model, names)
+    if key not in _row_classes:
+        _row_classes[key] = collections.namedtuple(model.__name__ + 'Row', names, rename=True)
+    return _row_classes[key]
+
+
+_write_plans = {}   #: Compiled write plans, by mapper
+
+
+def _write_plan(mapper):
+    """Returns the write plan of `mapper`, a dict of {property key: (handler, property)}
+    used by `Resource._update`. The plan is compiled on first use and cached, so
+    relationship direction and list/scalar checks are done once per mapper.
+    """
+    plan = _write_plans.get(mapper)
+    if plan is None:
+        plan = {}
+        for prop in mapper.iterate_properties:
+            if not isinstance(prop, sqlalchemy.orm.RelationshipProperty):
+                handler = Resource._update_column
+            elif prop.direction is sqlalchemy.orm.interfaces.MANYTOMANY:
+                handler = Resource._update_many_to_many
+            elif prop.uselist:
+                handler = Resource._update_list
+            else:
+                handler = Resource._update_scalar
+            plan[prop.key] = (handler, prop)
+
+        _write_plans[mapper] = plan
+    return plan
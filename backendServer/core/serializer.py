@@ -0,0 +1,97 @@
+__author__ = 'Azharul'
+
+import json
+import decimal
+import datetime
+import operator
+from sqlalchemy import orm
+
+from core.page import Page
+
+
+def json_default(obj):
+    """`default` hook of json.dumps for dates and decimals"""
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    elif isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+class Serializer(object):
+    """Converts models of a mapper to dicts and JSON. The attributes to read are
+    compiled once from the mapped columns, optional `extra` properties (e.g.
+    `status_info`) and `related` relationships, which are serialized with their
+    own Serializer::
+
+        serializer = get_serializer(Invoice, extra=('status_info',), related={'lines': {}})
+        serializer.to_dict(invoice)
+        serializer.to_json(page)
+
+    Use `get_serializer` instead of creating instances, to reuse compiled serializers.
+    """
+    def __init__(self, mapper, extra=(), related=None):
+        self.mapper = mapper
+        self.fields = tuple(prop.key for prop in mapper.column_attrs) + tuple(extra)
+        self._getter = operator.attrgetter(*self.fields) if len(self.fields) > 1 else \
+            (lambda model, getter=operator.attrgetter(*self.fields): (getter(model),))
+
+        self.related = []
+        for key, spec in _related_items(related):
+            prop = mapper.get_property(key)
+            self.related.append((key, prop.uselist, get_serializer(prop.mapper, **spec)))
+
+    def to_dict(self, model):
+        data = dict(zip(self.fields, self._getter(model)))
+        for key, uselist, serializer in self.related:
+            value = getattr(model, key)
+            if uselist:
+                data[key] = [serializer.to_dict(v) for v in value]
+            else:
+                data[key] = serializer.to_dict(value) if value is not None else None
+
+        return data
+
+    def to_list(self, models):
+        to_dict = self.to_dict
+        return [to_dict(model) for model in models]
+
+    def to_json(self, obj):
+        """Returns JSON of a model, a list of models or a `Page`, in which case
+        `Page.metadata` (with the cursors of a `CursorPage`) and `rows` are serialized
+        """
+        if isinstance(obj, Page):
+            data = obj.metadata()
+            data['rows'] = self.to_list(obj.rows)
+        elif isinstance(obj, (list, tuple)):
+            data = self.to_list(obj)
+        else:
+            data = self.to_dict(obj)
+
+        return json.dumps(data, default=json_default, separators=(',', ':'))
+
+
+def _related_items(related):
+    """Normalizes `related` given as list of names or {name: Serializer kwargs}"""
+    if not related:
+        return []
+    if isinstance(related, dict):
+        return sorted(related.items())
+    return [(key, {}) for key in related]
+
+def _spec_key(extra=(), related=None):
+    return tuple(extra), tuple((key, _spec_key(**spec)) for key, spec in _related_items(related))
+
+
+_serializers = {}   #: Compiled serializers, by (mapper, extra, related)
+
+
+def get_serializer(mapper_or_class, extra=(), related=None):
+    """Returns the Serializer of a mapper (or mapped class) for the given `extra`
+    properties and `related` relationships, compiled on first use
+    """
+    mapper = orm.class_mapper(mapper_or_class) if isinstance(mapper_or_class, type) else mapper_or_class
+    key = (mapper, _spec_key(extra, related))
+    if key not in _serializers:
+        _serializers[key] = Serializer(mapper, extra, related)
+    return _serializers[key]
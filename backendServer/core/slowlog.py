@@ -0,0 +1,188 @@
+__author__ = 'Azharul'
+
+import os
+import json
+import time
+import threading
+
+from core import instrumentation
+
+__all__ = ['enable', 'disable', 'stats', 'read_log', 'aggregate', 'percentile']
+
+
+class SlowQueryLog(object):
+    """Collects statements slower than `threshold` seconds by fingerprint. The
+    query plan of a SELECT is captured on its first slow execution. `rows` is
+    taken from `cursor.rowcount`; drivers not setting it for SELECT (sqlite3
+    reports -1) leave it None, i.e. unknown. If `path`
+    is given, every slow execution is also appended to it as a JSON line, so the
+    executions of all worker processes can be aggregated by the `slowqueries`
+    management command.
+    """
+    max_samples = 1000  #: durations kept per fingerprint for percentiles
+
+    def __init__(self, threshold, path=None):
+        self.threshold = threshold
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, conn, statement, parameters, duration, cursor):
+        if duration < self.threshold:
+            return
+
+        key = instrumentation.fingerprint(statement)
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = {'fingerprint': key, 'statement': statement, 'durations': [],
+                                             'count': 0, 'total': 0.0, 'rows': None, 'max': 0.0, 'plan': None}
+                entry['plan'] = explain(conn, cursor, statement, parameters)
+
+            entry['count'] += 1
+            entry['total'] += duration
+            entry['rows'] = _add_rows(entry['rows'], rows)
+            entry['max'] = max(entry['max'], duration)
+            if len(entry['durations']) < self.max_samples:
+                entry['durations'].append(duration)
+
+        if self.path:
+            self.write({'fingerprint': key, 'statement': statement, 'duration': duration,
+                        'rows': rows, 'plan': entry['plan'], 'time': time.time(), 'pid': os.getpid()})
+
+    def write(self, record):
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+        except (IOError, OSError):
+            pass
+
+
+def explain(conn, cursor, statement, parameters):
+    """Returns query plan of a SELECT statement as list of rows, using the same
+    DBAPI connection and parameters. None if the plan can't be captured.
+
+    A failing EXPLAIN would abort the application's transaction on PostgreSQL,
+    so it runs inside a savepoint, rolled back on failure.
+    """
+    if not statement.lstrip().upper().startswith('SELECT') or isinstance(parameters, list):
+        return None
+
+    sqlite = conn.dialect.name == 'sqlite'
+    prefix = 'EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN '
+    try:
+        plan_cursor = cursor.connection.cursor()
+    except Exception as e:
+        return [['EXPLAIN failed: %s' % e]]
+
+    try:
+        # SQLite's EXPLAIN QUERY PLAN doesn't affect the transaction
+        savepoint = not sqlite and _execute(plan_cursor, 'SAVEPOINT slowlog_explain')
+        try:
+            plan_cursor.execute(prefix + statement, parameters)
+            plan = [[str(value) for value in row] for row in plan_cursor.fetchall()]
+        except Exception as e:
+            if savepoint:
+                _execute(plan_cursor, 'ROLLBACK TO SAVEPOINT slowlog_explain')
+            return [['EXPLAIN failed: %s' % e]]
+
+        if savepoint:
+            _execute(plan_cursor, 'RELEASE SAVEPOINT slowlog_explain')
+        return plan
+    finally:
+        plan_cursor.close()
+
+def _execute(cursor, statement):
+    """Executes `statement`, returns False if it failed (e.g. SAVEPOINT on an
+    autocommit connection, where EXPLAIN can't abort a transaction anyway)
+    """
+    try:
+        cursor.execute(statement)
+        return True
+    except Exception:
+        return False
+
+
+_log = None
+
+
+def enable(engine, threshold, path=None):
+    """Starts collecting statements of `engine` slower than `threshold` seconds
+    """
+    global _log
+    disable()
+    _log = SlowQueryLog(threshold, path)
+    instrumentation.install(engine)
+    instrumentation.add_collector(_log)
+    return _log
+
+def disable():
+    global _log
+    if _log is not None:
+        instrumentation.remove_collector(_log)
+        _log = None
+
+def stats():
+    """Returns aggregated slow statements of this process, see `aggregate`
+    """
+    if _log is None:
+        return []
+
+    result = []
+    with _log._lock:
+        for entry in _log.entries.values():
+            durations = sorted(entry['durations'])
+            summary = dict((k, v) for k, v in entry.items() if k != 'durations')
+            summary.update(p50=percentile(durations, 50), p95=percentile(durations, 95))
+            result.append(summary)
+
+    return sorted(result, key=lambda g: g['total'], reverse=True)
+
+
+def read_log(path):
+    """Yields (fingerprint, statement, duration, rows, plan) of a slow query log file
+    """
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            yield record['fingerprint'], record['statement'], record['duration'], record.get('rows'), record.get('plan')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted `values`"""
+    if not values:
+        return None
+    index = max(int(round(p / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+def _add_rows(total, rows):
+    """Sum of row counts, None (unknown) until a count is known"""
+    if rows is None:
+        return total
+    return (total or 0) + rows
+
+def aggregate(executions):
+    """Aggregates (fingerprint, statement, duration, rows, plan) tuples by fingerprint
+
+    :return: list of dicts with fingerprint, statement, count, total, p50, p95, max, rows and plan.
+             `rows` is None if no execution reported its row count.
+    """
+    groups = {}
+    for key, statement, duration, rows, plan in executions:
+        group = groups.setdefault(key, {'fingerprint': key, 'statement': statement, 'durations': [], 'rows': None, 'plan': None})
+        group['durations'].append(duration)
+        group['rows'] = _add_rows(group['rows'], rows)
+        group['plan'] = group['plan'] or plan
+
+    result = []
+    for group in groups.values():
+        durations = sorted(group.pop('durations'))
+        group.update(count=len(durations), total=sum(durations), max=durations[-1],
+                     p50=percentile(durations, 50), p95=percentile(durations, 95))
+        result.append(group)
+
+    return sorted(result, key=lambda g: g['total'], reverse=True)
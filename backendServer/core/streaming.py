@@ -0,0 +1,72 @@
+__author__ = 'Azharul'
+
+import json
+from django.http import StreamingHttpResponse
+
+from core.page import Page
+from core.serializer import get_serializer, json_default
+
+
+def _row_dict(row):
+    if hasattr(row, 'to_dict'):
+        return row.to_dict()
+    return row._asdict()
+
+def stream_json(rows, serializer=None, page=None, chunk_size=500):
+    """Yields JSON of `rows` in chunks of `chunk_size` rows, as
+    {"page": .., "total": .., "records": .., "exact": .., "rows": [..]} envelope
+    if `page` is given, otherwise as a plain array. The envelope of a `CursorPage`
+    has `next_cursor` and `prev_cursor` as well, see `Page.metadata`.
+
+    :param rows: Iterable of models or named tuples, e.g. `Resource.iter()`
+    :param serializer: Optional, `core.serializer.Serializer` for the models
+    :param page: Optional, `Page` object supplying the metadata
+    """
+    to_dict = serializer.to_dict if serializer else _row_dict
+    dumps = lambda obj: json.dumps(obj, default=json_default, separators=(',', ':'))
+
+    if page is not None:
+        yield '{%s,"rows":[' % ','.join('%s:%s' % (dumps(key), dumps(value)) for key, value in page.metadata().items())
+    else:
+        yield '['
+
+    chunk, separator = [], ''
+    for row in rows:
+        chunk.append(separator + dumps(to_dict(row)))
+        separator = ','
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+
+    if chunk:
+        yield ''.join(chunk)
+    yield ']}' if page is not None else ']'
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """Streams `rows` as JSON, see `stream_json`. Time to first byte and memory
+    use don't depend on the number of rows.
+    """
+    def __init__(self, rows, serializer=None, page=None, chunk_size=500, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super(StreamingJsonResponse, self).__init__(stream_json(rows, serializer, page, chunk_size), **kwargs)
+
+
+def paginated_json_response(resource, query=None, page=1, limit=None, serializer=None, batch_size=1000, **kwargs):
+    """Streams a page of `query` (all models of `resource` by default) with the
+    `Page` metadata. Records are counted by `resource.count_strategy` and rows
+    are read via `Resource.iter`, so the page is never materialized::
+
+        return paginated_json_response(InvoiceResource(), page=request.GET.get('page'), limit=50000)
+
+    :return: StreamingJsonResponse
+    """
+    query = query or resource.query()
+    records, exact = resource.count_strategy(query)
+
+    page = Page(page, limit if type(limit) == int else None, records, exact)
+    if page.limit:
+        query = query.limit(page.limit).offset((page.page - 1) * page.limit)
+
+    serializer = serializer or get_serializer(resource.mapper)
+    return StreamingJsonResponse(resource.iter(query, batch_size), serializer, page, **kwargs)
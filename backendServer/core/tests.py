@@ -0,0 +1,188 @@
+__author__ = 'Azharul'
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+from formencode import validators
+from django.test import SimpleTestCase
+
+from core.model import Model
+from core.resource import Resource
+from core.validators import ModelValidator
+from core import readcache
+
+metadata = sa.MetaData()
+
+currency_table = sa.Table('test_currency', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('code', sa.String(3)),
+    sa.Column('company_id', sa.Integer))
+
+
+class Currency(Model):
+    pass
+
+currency_mapper = orm.mapper(Currency, currency_table)
+
+
+class CurrencyValidator(ModelValidator):
+    code = validators.String(not_empty=True)
+
+
+class CurrencyResource(Resource):
+    mapper = currency_mapper
+    validate_with = CurrencyValidator
+    named_queries = {
+        'by_code': lambda query, model: query.filter(model.code == sa.bindparam('code')),
+    }
+
+
+tag_table = sa.Table('test_tag', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(20)))
+
+tag_group_table = sa.Table('test_tag_group', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(20)),
+    sa.Column('created', sa.String(30)),
+    sa.Column('updated', sa.String(30)))
+
+tag_group_member_table = sa.Table('test_tag_group_member', metadata,
+    sa.Column('group_id', sa.Integer, sa.ForeignKey('test_tag_group.id'), primary_key=True),
+    sa.Column('tag_id', sa.Integer, sa.ForeignKey('test_tag.id'), primary_key=True))
+
+
+class Tag(Model):
+    pass
+
+
+class TagGroup(Model):
+    pass
+
+orm.mapper(Tag, tag_table)
+tag_group_mapper = orm.mapper(TagGroup, tag_group_table, properties={
+    'tags': orm.relationship(Tag, secondary=tag_group_member_table),
+})
+
+
+class TagGroupValidator(ModelValidator):
+    name = validators.String(not_empty=True)
+    tags = validators.Set()
+
+
+class TagGroupResource(Resource):
+    mapper = tag_group_mapper
+    validate_with = TagGroupValidator
+
+
+class User(object):
+    id = 1
+    company_id = 1
+
+
+class ResourceReadTest(SimpleTestCase):
+    """`read` and `paginate` against a mapped table, with and without baked queries"""
+
+    def setUp(self):
+        engine = sa.create_engine('sqlite://')
+        metadata.create_all(engine)
+        engine.execute(currency_table.insert(), [{'code': code, 'company_id': company_id}
+                                                 for code, company_id in [('USD', 1), ('EUR', 1), ('BDT', 1), ('GBP', 2)]])
+        self.session = orm.scoped_session(orm.sessionmaker(bind=engine))
+
+    def tearDown(self):
+        self.session.remove()
+
+    def resource(self, **attrs):
+        resource = CurrencyResource()
+        resource.session = self.session
+        resource.user = User()
+        resource.__dict__.update(attrs)
+        return resource
+
+    def test_read(self):
+        for bake in (True, False):
+            resource = self.resource(bake_queries=bake)
+            self.assertEqual(resource.read(2).code, 'EUR')
+            self.assertEqual(resource.read('2').code, 'EUR')
+            # other company's row is filtered
+            self.assertIsNone(resource.read(4))
+
+    def test_paginate(self):
+        for bake in (True, False):
+            page = self.resource(bake_queries=bake).paginate(page=2, limit=2)
+            self.assertEqual(page.records, 3)
+            self.assertEqual([c.code for c in page.rows], ['BDT'])
+
+    def test_paginate_window_count_empty(self):
+        resource = self.resource()
+        statements = []
+        sa.event.listen(self.session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        page = resource.paginate(page=5, limit=2, window_count=True)
+        self.assertEqual((page.records, page.rows), (3, []))
+        self.assertEqual(len(statements), 2)
+
+    def test_named(self):
+        self.assertEqual(self.resource().named('by_code', code='USD').one().id, 1)
+        self.assertIsNone(self.resource().named('by_code', code='GBP').first())
+
+    def test_read_cache(self):
+        resource = self.resource(read_cache=readcache.LocalReadCache())
+        self.assertEqual(resource.read(1).code, 'USD')
+        self.session.remove()
+        self.assertEqual(resource.read(1).code, 'USD')
+        self.assertEqual(resource.read_cache.stats()['hits'], 1)
+
+    def test_lookup_cache_rollback(self):
+        resource = self.resource(cache_lookups=True)
+        resource.update({'Currency': {'code': 'XXX'}}, resource.read(1))
+        self.assertEqual(resource.option_list(value='code')[-1], {'id': 1, 'text': 'XXX'})
+        self.session.rollback()
+        self.assertEqual(resource.option_list(value='code')[-1], {'id': 1, 'text': 'USD'})
+
+    def test_read_cache_session(self):
+        resource = self.resource(read_cache=readcache.LocalReadCache())
+        resource.read(2)
+        self.session.remove()
+        # unflushed changes of a model in the session aren't overwritten by the cached copy
+        model = resource.read(2)
+        model.code = 'XXX'
+        self.assertIs(resource.read(2), model)
+        self.assertEqual(model.code, 'XXX')
+
+        # no reads are cached while the transaction has uncommitted writes
+        resource.update({'Currency': {'code': 'YYY'}}, resource.read(1))
+        self.session.expunge_all()
+        self.assertEqual(resource.read(1).code, 'YYY')
+        self.session.rollback()
+        self.session.expunge_all()
+        self.assertEqual(resource.read(1).code, 'USD')
+
+
+class ResourceManyToManyTest(SimpleTestCase):
+    """Association rows written by `update` for a many-to-many field"""
+
+    def setUp(self):
+        engine = sa.create_engine('sqlite://')
+        metadata.create_all(engine)
+        engine.execute(tag_table.insert(), [{'name': 'Tag %d' % i} for i in range(1, 5)])
+        self.session = orm.scoped_session(orm.sessionmaker(bind=engine))
+        self.resource = TagGroupResource()
+        self.resource.session = self.session
+        self.resource.user = User()
+
+    def tearDown(self):
+        self.session.remove()
+
+    def update(self, group, tag_ids, enable_delete=False):
+        data = {'TagGroup': {'name': 'Group', 'tags': [{'tag_id': tag_id} for tag_id in tag_ids]}}
+        self.resource.update(data, group, enable_delete=enable_delete, commit=True)
+        return sorted(row[0] for row in self.session.execute(sa.select([tag_group_member_table.c.tag_id])))
+
+    def test_string_keys(self):
+        group = self.resource.create({'TagGroup': {'name': 'Group', 'tags': []}}, commit=True)
+        self.assertEqual(self.update(group, [2, 3]), [2, 3])
+        # keys submitted as strings match the linked integer keys
+        self.assertEqual(self.update(group, ['2', '3'], enable_delete=True), [2, 3])
+        self.assertEqual(self.update(group, ['3', '4'], enable_delete=True), [3, 4])
+        # unknown keys are ignored
+        self.assertEqual(self.update(group, ['4', '9']), [3, 4])
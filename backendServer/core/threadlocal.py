@@ -1,5 +1,6 @@
 __author__ = 'Azharul'
 
+import time
 import threading
 
 from core.dbconfig import create_session
@@ -17,6 +18,7 @@ def set(key, value):
 def db_session():
     if get('session') is None:
         set('session', create_session())
+        set('session_started', time.time())
 
     return get('session')
 
@@ -3,6 +3,8 @@ __author__ = 'Azharul'
 import six
 import re
 import copy
+import time
+import threading
 import collections
 from collections import OrderedDict
 
@@ -280,6 +282,63 @@ class OrderedSet(object):
         return bool(self.dict)
 
 
+class LRUCache(object):
+    """
+    A thread safe mapping bounded to `maxsize` items, which evicts the least
+    recently used item when full. If `ttl` (seconds) is given, older items are
+    treated as missing. `hits` and `misses` count the lookups.
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()     # key: (expires, value)
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires < time.time():
+                self.misses += 1
+                return default
+
+            # re-insert as most recently used
+            self._items[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (time.time() + ttl if ttl is not None else None, value)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def delete_matching(self, func):
+        """Removes all items for which `func(key)` returns True"""
+        with self._lock:
+            for key in [k for k in self._items if func(k)]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
 class MultiValueDictKeyError(KeyError):
     pass
 
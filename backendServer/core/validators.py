@@ -2,6 +2,7 @@ from core import threadlocal
 
 __author__ = 'Azharul'
 
+import copy
 import datetime
 import decimal
 import hashlib
@@ -414,15 +415,7 @@ class ModelValidator(Schema):
 
     pre_validators = [PreserveState('inactive') ]
 
-    def __init__(self, *args, **kwargs):
-        Schema.__init__(self, *args, **kwargs)
-
-        for v in self.fields.itervalues():
-            for attr in ('if_empty', 'if_missing', 'if_invalid', 'min', 'max', 'value'):
-                if hasattr(v, attr):
-                    default = getattr(v, attr)
-                    if default is not formencode.api.NoDefault and callable(default):
-                        setattr(v, attr, default())
+    _callable_defaults = None   #: [(field name, attribute)] having callable values, compiled on first use
 
     @declarative.classinstancemethod
     def add_field(self, cls, name, validator):
@@ -437,9 +430,44 @@ class ModelValidator(Schema):
                     setattr(validator, attr, validator.default)
 
         Schema.add_field.func(self, cls, name, validator)
+        if self is not None:
+            self._callable_defaults = None
+
+    def callable_defaults(self):
+        """Returns list of (field name, attribute) pairs for the default/min/max
+        values declared as callables, e.g. `Date(default=Date.now)`. The list is
+        compiled once per validator instance.
+        """
+        if self._callable_defaults is None:
+            self._callable_defaults = [
+                (name, attr) for name, v in self.fields.iteritems()
+                for attr in ('if_empty', 'if_missing', 'if_invalid', 'min', 'max', 'value')
+                if getattr(v, attr, formencode.api.NoDefault) is not formencode.api.NoDefault
+                and callable(getattr(v, attr))
+            ]
+        return self._callable_defaults
+
+    def resolved(self):
+        """Returns the schema to use for a single validation: `self` if no field
+        has callable defaults, otherwise a copy of `self` with copies of those
+        fields, having the callables evaluated. Shared field objects are never
+        modified, so validator instances can be cached and reused.
+        """
+        callable_defaults = self.callable_defaults()
+        if not callable_defaults:
+            return self
+
+        schema = copy.copy(self)
+        schema.fields = dict(self.fields)
+        for name, attr in callable_defaults:
+            if schema.fields[name] is self.fields[name]:
+                schema.fields[name] = copy.copy(self.fields[name])
+            setattr(schema.fields[name], attr, getattr(self.fields[name], attr)())
+
+        return schema
 
     def _to_python(self, value_dict, state):
-        return Schema._to_python(self, value_dict, getattr(self, 'dao', state))
+        return Schema._to_python(self.resolved(), value_dict, getattr(self, 'dao', state))
 
     @classmethod
     def default_data(cls, model_name):
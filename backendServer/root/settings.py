@@ -37,9 +37,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'core',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.DBSessionMiddleware',
+    'core.middleware.SQLInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +86,25 @@ DATABASES = {
 }
 
 
+# Connection pool of core.dbconfig, see core.dbconfig.pool_options
+DATABASE_POOL = {
+    'SIZE': 20,
+    'MAX_OVERFLOW': 10,
+    'TIMEOUT': 30,
+    'PRE_PING': True,
+    'LIFO': False,
+}
+
+# Threads running Resource.gather calls, each holds a database connection while running
+GATHER_MAX_WORKERS = 8
+
+# Names of DATABASES entries used as read only replicas of 'default', see
+# core.dbconfig.RoutingSession. Reads stick to 'default' for
+# DATABASE_REPLICA_STICKY_SECONDS after a write.
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_STICKY_SECONDS = 5
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
 
@@ -136,6 +158,12 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
 
+# Slow query log, see core.slowlog. Statements slower than SLOW_QUERY_THRESHOLD
+# seconds are logged, disabled if None
+SLOW_QUERY_THRESHOLD = None
+SLOW_QUERY_LOG_FILE = os.path.join(BASE_DIR, 'slow_queries.log')
+
+
 REST_FRAMEWORK = {
     'TEST_REQUEST_DEFAULT_FORMAT': 'json'
 }